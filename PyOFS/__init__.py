@@ -16,6 +16,10 @@ AZURE_CREDENTIALS_FILENAME = Path(os.getenv('AZURE_CRED', r'C:\data\azure_creden
 # default nodata value used by leaflet-geotiff renderer
 LEAFLET_NODATA_VALUE = -9999.0
 
+# floating point type of observation data from decoding through compositing and averaging
+# (accumulators that need the extra precision use float64 explicitly)
+OBSERVATION_DTYPE = numpy.float32
+
 # using relative values with the PREDICTOR option will break rendering in Leaflet.CanvasLayer.Field
 TIFF_CREATION_OPTIONS = {
     'TILED': 'YES',
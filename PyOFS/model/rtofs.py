@@ -13,7 +13,6 @@ from rasterio.enums import Resampling
 import rasterio.features
 import rasterio.mask
 import rasterio.warp
-from shapely import geometry
 import xarray
 
 import PyOFS
@@ -112,9 +111,7 @@ class RTOFSDataset:
         self.time_interval = time_interval
 
         self.study_area_polygon_filename = study_area_polygon_filename
-        self.study_area_geojson = utilities.get_first_record(self.study_area_polygon_filename)[
-            'geometry'
-        ]
+        self.study_area = utilities.get_first_geometry(self.study_area_polygon_filename)
 
         self.datasets = {}
         self.dataset_locks = {}
@@ -165,7 +162,7 @@ class RTOFSDataset:
                 self.study_area_south,
                 self.study_area_east,
                 self.study_area_north,
-            ) = geometry.shape(self.study_area_geojson).bounds
+            ) = self.study_area.bounds
 
             self.study_area_transform = rasterio.transform.from_origin(
                 self.study_area_west, self.study_area_north, lon_pixel_size, lat_pixel_size
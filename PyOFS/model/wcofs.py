@@ -489,9 +489,7 @@ class WCOFSDataset:
         if variables is None:
             variables = list(DATA_VARIABLES.keys())
 
-        study_area_geojson = utilities.get_first_record(study_area_polygon_filename)[
-            'geometry'
-        ]
+        study_area_geometry = utilities.get_first_geometry(study_area_polygon_filename).geometry
 
         if x_size is None or y_size is None:
             sample_dataset = next(iter(self.datasets.values()))
@@ -669,7 +667,7 @@ class WCOFSDataset:
 
                 with memory_file.open() as memory_raster:
                     masked_data, masked_transform = rasterio.mask.mask(
-                        memory_raster, [study_area_geojson]
+                        memory_raster, [study_area_geometry]
                     )
 
             masked_data = masked_data[0, :, :]
@@ -1310,9 +1308,7 @@ class WCOFSRange:
         if not isinstance(study_area_polygon_filename, Path):
             study_area_polygon_filename = Path(study_area_polygon_filename)
 
-        study_area_geojson = utilities.get_first_record(study_area_polygon_filename)[
-            'geometry'
-        ]
+        study_area_geometry = utilities.get_first_geometry(study_area_polygon_filename).geometry
 
         if x_size is None or y_size is None:
             sample_dataset = next(iter(next(iter(self.datasets.values())).datasets.values()))
@@ -1499,7 +1495,7 @@ class WCOFSRange:
 
                         with memory_file.open() as memory_raster:
                             masked_data, masked_transform = rasterio.mask.mask(
-                                memory_raster, [study_area_geojson]
+                                memory_raster, [study_area_geometry]
                             )
 
                     masked_data = masked_data[0, :, :]
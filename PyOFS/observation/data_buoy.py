@@ -1,8 +1,11 @@
 from concurrent import futures
-from datetime import datetime
+import csv
+from datetime import datetime, timedelta
+from functools import partial
 from os import PathLike
 from pathlib import Path
 import re
+import threading
 
 import fiona
 import fiona.crs
@@ -31,8 +34,20 @@ MEASUREMENT_VARIABLES = [
 
 OUTPUT_CRS = fiona.crs.from_epsg(CRS_EPSG)
 
-STUDY_AREA_POLYGON_FILENAME = DATA_DIRECTORY / r'reference\wcofs.gpkg:study_area'
-WCOFS_NDBC_STATIONS_FILENAME = DATA_DIRECTORY / r'reference\ndbc_stations.txt'
+STUDY_AREA_POLYGON_FILENAME = DATA_DIRECTORY / 'reference' / 'wcofs.gpkg:study_area'
+WCOFS_NDBC_STATIONS_FILENAME = DATA_DIRECTORY / 'reference' / 'ndbc_stations.txt'
+
+# registry of station locations and variables, refreshed from the catalog after the given time
+STATION_REGISTRY_FILENAME = DATA_DIRECTORY / 'input' / 'ndbc' / 'stations.csv'
+STATION_REGISTRY_TTL = timedelta(days=7)
+STATION_REGISTRY_FIELDS = ['name', 'lon', 'lat', 'variables', 'last_updated']
+_STATION_REGISTRY_LOCK = threading.Lock()
+
+# local time series of stations, appended with newer records on every run
+STATION_STORE_DIRECTORY = DATA_DIRECTORY / 'input' / 'ndbc' / 'stations'
+
+# maximum number of stations contacted at once
+MAX_CONCURRENT_STATIONS = 8
 
 CATALOG_URL = 'https://dods.ndbc.noaa.gov/thredds/catalog/data/ocean/catalog.html'
 SOURCE_URL = 'https://dods.ndbc.noaa.gov/thredds/dodsC/data/ocean'
@@ -43,19 +58,27 @@ class DataBuoyDataset:
     Dataset of NDBC buoy.
     """
 
-    def __init__(self, station_name: str):
+    def __init__(self, station_name: str, use_store: bool = True):
         """
         NDBC data buoy
 
         :param station_name: station name
+        :param use_store: whether to serve data from the local time series store, fetching only records newer than those already stored
         :raises NoDataError: if observation does not exist
         """
 
         self.station_name = station_name
         self.url = f'{SOURCE_URL}/{self.station_name}/{self.station_name}o9999.nc'
 
+        if use_store:
+            self.dataset = update_station_store(self.station_name, self.url)
+        else:
+            try:
+                self.dataset = xarray.open_dataset(self.url)
+            except:
+                raise PyOFS.NoDataError(f'No NDBC observation found at {self.url}')
+
         try:
-            self.dataset = xarray.open_dataset(self.url)
             self.longitude = self.dataset['longitude'].values.item()
             self.latitude = self.dataset['latitude'].values.item()
         except:
@@ -82,6 +105,36 @@ class DataBuoyDataset:
 
         return self.dataset[variable].sel(time=slice(start_time, end_time))
 
+    def data_average(
+        self, variables: [str], start_time: datetime, end_time: datetime
+    ) -> numpy.array:
+        """
+        Average the given variables over the given time interval, reading them in a single request.
+
+        :param variables: variable names
+        :param start_time: beginning of time interval
+        :param end_time: end of time interval
+        :return: array of averages in the order of the given variables, NaN where a variable is not measured
+        """
+
+        available_variables = [variable for variable in variables if variable in self.dataset]
+
+        output_data = numpy.full(len(variables), numpy.nan)
+
+        if len(available_variables) > 0:
+            variable_means = (
+                self.dataset[available_variables]
+                .sel(time=slice(start_time, end_time))
+                .mean('time', skipna=True)
+                .load()
+            )
+
+            for variable_index, variable in enumerate(variables):
+                if variable in variable_means:
+                    output_data[variable_index] = variable_means[variable].values.item()
+
+        return output_data
+
     def __repr__(self) -> str:
         return f'{self.__class__.__name__}({self.station_name})'
 
@@ -91,19 +144,28 @@ class DataBuoyRange:
     Data from multiple NDBC buoys.
     """
 
-    def __init__(self, stations: [str] = None):
+    def __init__(
+        self,
+        stations: [str] = None,
+        study_area_polygon_filename: PathLike = STUDY_AREA_POLYGON_FILENAME,
+    ):
         """
         Collection of NDBC data buoys
 
-        :param stations: list of station names
+        :param stations: list of station names; if not given, uses stations of the station registry within the study area
+        :param study_area_polygon_filename: vector file containing study area boundary
         :raises NoDataError: if data does not exist
         """
 
         if stations is None:
-            with requests.get(CATALOG_URL) as station_catalog:
-                self.station_names = re.findall(
-                    "href='(.*?)/catalog.html'", station_catalog.text
-                )
+            # only contact stations located within the study area
+            registry = station_registry()
+            self.station_names = stations_within(
+                [station['name'] for station in registry],
+                [station['lon'] for station in registry],
+                [station['lat'] for station in registry],
+                study_area_polygon_filename,
+            )
         elif type(stations) is str:
             self.station_names = list(
                 numpy.genfromtxt(WCOFS_NDBC_STATIONS_FILENAME, dtype='str')
@@ -116,7 +178,7 @@ class DataBuoyRange:
         LOGGER.debug(f'Collecting NDBC data from {len(self.station_names)} station...')
 
         # concurrently populate dictionary with datasets for each station
-        with futures.ThreadPoolExecutor() as concurrency_pool:
+        with futures.ThreadPoolExecutor(MAX_CONCURRENT_STATIONS) as concurrency_pool:
             running_futures = {
                 concurrency_pool.submit(DataBuoyDataset, station_name): station_name
                 for station_name in self.station_names
@@ -160,27 +222,42 @@ class DataBuoyRange:
 
     def data_average(
         self, variables: [str], start_time: datetime, end_time: datetime
-    ) -> {str: {str: float}}:
+    ) -> xarray.DataArray:
         """
-        Get data of given variables within given time interval.
+        Get averages of given variables within given time interval for all stations, reading stations concurrently.
 
-        :param variables:
+        :param variables: variable names
         :param start_time: Start of time interval.
         :param end_time: End of time interval.
-        :return:
+        :return: array of averages with dimensions (station, variable)
         """
 
-        output_data = {}
+        station_names = list(self.stations)
+        output_data = numpy.full((len(station_names), len(variables)), numpy.nan)
 
-        for station_name, station in self.stations.items():
-            output_data[station_name] = {}
+        with futures.ThreadPoolExecutor(MAX_CONCURRENT_STATIONS) as concurrency_pool:
+            running_futures = {
+                concurrency_pool.submit(
+                    self.stations[station_name].data_average, variables, start_time, end_time
+                ): station_index
+                for station_index, station_name in enumerate(station_names)
+            }
 
-            for variable in variables:
-                output_data[station_name][variable] = float(
-                    station.data(variable, start_time, end_time).mean('time', skipna=True)
-                )
+            for completed_future in futures.as_completed(running_futures):
+                station_index = running_futures[completed_future]
 
-        return output_data
+                if completed_future.exception() is None:
+                    output_data[station_index] = completed_future.result()
+                else:
+                    LOGGER.warning(
+                        f'{station_names[station_index]}: {completed_future.exception()}'
+                    )
+
+        return xarray.DataArray(
+            output_data,
+            coords={'station': station_names, 'variable': list(variables)},
+            dims=('station', 'variable'),
+        )
 
     def write_vector(
         self,
@@ -208,47 +285,19 @@ class DataBuoyRange:
 
         station_data = self.data_average(variables, start_time, end_time)
 
-        # # concurrently populate dictionary with data for each station within given time interval
-        # with futures.ThreadPoolExecutor() as concurrency_pool:
-        #     running_futures = {
-        #         station_name: {
-        #             variable: concurrency_pool.submit(station.data, variable, start_time, end_time)
-        #             for variable in variables}
-        #         for station_name, station in self.stations.items()
-        #     }
-        #
-        #     for station_name, station_running_futures in running_futures:
-        #         station_data[station_name] = {}
-        #
-        #         for completed_future in futures.as_completed(station_running_futures):
-        #             result = completed_future.result()
-        #
-        #             if result is not None:
-        #                 station_data[station_name][station_running_futures[completed_future]] = result
-
         schema = {
             'geometry': 'Point',
-            'properties': {
-                'name': 'str',
-                'longitude': 'float',
-                'latitude': 'float',
-                'water_temperature': 'float',
-                'conductivity': 'float',
-                'salinity': 'float',
-                'o2_saturation': 'float',
-                'dissolved_oxygen': 'float',
-                'chlorophyll_concentration': 'float',
-                'turbidity': 'float',
-                'water_ph': 'float',
-                'water_eh': 'float',
-            },
+            'properties': {'name': 'str', 'longitude': 'float', 'latitude': 'float'},
         }
+        schema['properties'].update({variable: 'float' for variable in variables})
 
         LOGGER.debug('Creating features...')
 
         layer_records = []
 
-        for station_name, station_data in station_data.items():
+        for station_name, station_means in zip(
+            station_data['station'].values.tolist(), station_data.values.tolist()
+        ):
             station = self.stations[station_name]
 
             record = {
@@ -260,17 +309,9 @@ class DataBuoyRange:
                     'name': station_name,
                     'longitude': station.longitude,
                     'latitude': station.latitude,
-                    'water_temperature': station_data['water_temperature'],
-                    'conductivity': station_data['conductivity'],
-                    'salinity': station_data['salinity'],
-                    'o2_saturation': station_data['o2_saturation'],
-                    'dissolved_oxygen': station_data['dissolved_oxygen'],
-                    'chlorophyll_concentration': station_data['chlorophyll_concentration'],
-                    'turbidity': station_data['turbidity'],
-                    'water_ph': station_data['water_ph'],
-                    'water_eh': station_data['water_eh'],
                 },
             }
+            record['properties'].update(dict(zip(variables, station_means)))
 
             layer_records.append(record)
 
@@ -298,29 +339,365 @@ class DataBuoyRange:
         return f'{self.__class__.__name__}({", ".join(used_params)})'
 
 
-def check_station(dataset: xarray.Dataset, study_area_polygon_filename: PathLike) -> bool:
+def station_store_filename(station_name: str) -> Path:
     """
-    Check whether station exists within the given study area.
+    Get path of the local time series store of the given station.
+
+    :param station_name: station name
+    :return: path to NetCDF file
+    """
+
+    return STATION_STORE_DIRECTORY / f'{station_name}.nc'
+
+
+def update_station_store(station_name: str, url: str) -> xarray.Dataset:
+    """
+    Append records newer than the last ingested record of the given station to its local store.
+    If the source cannot be reached, the stored records are returned as they are.
+
+    :param station_name: station name
+    :param url: OpenDAP URL of station observations
+    :return: dataset of all stored records
+    :raises NoDataError: if neither stored nor remote records exist, or the station measures none of `MEASUREMENT_VARIABLES`
+    """
+
+    store_filename = station_store_filename(station_name)
+
+    if store_filename.exists():
+        with xarray.open_dataset(store_filename) as stored_dataset:
+            stored_dataset = stored_dataset.load()
+        last_ingested = numpy.datetime64(stored_dataset.attrs['last_ingested'])
+    else:
+        stored_dataset = None
+        last_ingested = None
+
+    try:
+        with xarray.open_dataset(url) as remote_dataset:
+            variables = [
+                variable for variable in MEASUREMENT_VARIABLES if variable in remote_dataset
+            ]
+
+            if len(variables) == 0:
+                raise PyOFS.NoDataError(f'{station_name} measures none of {MEASUREMENT_VARIABLES}')
+
+            # request only records after the last ingested one
+            if last_ingested is not None:
+                start_index = numpy.searchsorted(
+                    remote_dataset['time'].values, last_ingested, side='right'
+                )
+            else:
+                start_index = 0
+
+            new_dataset = remote_dataset[variables].isel(time=slice(start_index, None)).load()
+            new_dataset.attrs = {}
+    except PyOFS.NoDataError:
+        raise
+    except Exception as error:
+        if stored_dataset is None:
+            raise PyOFS.NoDataError(f'No NDBC observation found at {url}: {error}')
+        LOGGER.warning(f'{station_name}: using stored records: {error.__class__.__name__}: {error}')
+        return stored_dataset
+
+    num_new_records = new_dataset.sizes.get('time', 0)
+
+    if num_new_records > 0:
+        if stored_dataset is not None:
+            stored_dataset = xarray.concat(
+                [stored_dataset, new_dataset],
+                dim='time',
+                data_vars='minimal',
+                coords='minimal',
+                compat='override',
+                join='outer',
+            )
+        else:
+            stored_dataset = new_dataset
+
+        stored_dataset.attrs['last_ingested'] = str(
+            stored_dataset['time'].values.max().astype('datetime64[s]')
+        )
+
+        for variable in stored_dataset.variables.values():
+            variable.encoding = {
+                key: value for key, value in variable.encoding.items() if key in ('units', 'calendar')
+            }
+
+        LOGGER.debug(f'{station_name}: storing {num_new_records} new records')
+
+        utilities.write_atomically(
+            store_filename,
+            partial(
+                stored_dataset.to_netcdf,
+                encoding={variable: {'zlib': True} for variable in stored_dataset.data_vars},
+            ),
+        )
+    elif stored_dataset is None:
+        raise PyOFS.NoDataError(f'No NDBC observation found at {url}')
+
+    return stored_dataset
+
+
+def catalog_station_names() -> [str]:
+    """
+    Get names of all stations in the NDBC THREDDS catalog.
+
+    :return: list of station names
+    :raises NoDataError: if the catalog lists no stations
+    """
+
+    with requests.get(CATALOG_URL) as station_catalog:
+        station_catalog.raise_for_status()
+        station_names = re.findall("href='(.*?)/catalog.html'", station_catalog.text)
+
+    if len(station_names) == 0:
+        raise PyOFS.NoDataError(f'No stations found in NDBC catalog at {CATALOG_URL}')
+
+    return station_names
+
+
+def read_station_metadata(station_name: str) -> dict:
+    """
+    Read location, available measurement variables and time of last record of the given station.
+
+    :param station_name: station name
+    :return: registry entry of station
+    :raises NoDataError: if station has no observations
+    """
+
+    url = f'{SOURCE_URL}/{station_name}/{station_name}o9999.nc'
+
+    try:
+        with xarray.open_dataset(url) as dataset:
+            return {
+                'name': station_name,
+                'lon': float(dataset['longitude'].values.item()),
+                'lat': float(dataset['latitude'].values.item()),
+                'variables': [
+                    variable for variable in MEASUREMENT_VARIABLES if variable in dataset
+                ],
+                'last_updated': dataset['time'][-1].values.astype('datetime64[s]').astype(datetime),
+            }
+    except Exception as error:
+        raise PyOFS.NoDataError(f'No NDBC observation found at {url}: {error}')
+
+
+def station_registry(
+    registry_filename: PathLike = STATION_REGISTRY_FILENAME,
+    ttl: timedelta = STATION_REGISTRY_TTL,
+    refresh: bool = False,
+) -> [dict]:
+    """
+    Get registry of NDBC stations (name, location, measurement variables and time of last record).
+    The registry is persisted to a CSV file and rebuilt from the catalog once it is older than the given time to live.
+
+    :param registry_filename: path to registry CSV file
+    :param ttl: time to live of registry
+    :param refresh: whether to rebuild the registry regardless of its age
+    :return: list of station entries
+    :raises NoDataError: if no registry exists and the catalog cannot be read
+    """
+
+    if not isinstance(registry_filename, Path):
+        registry_filename = Path(registry_filename)
+
+    with _STATION_REGISTRY_LOCK:
+        if registry_filename.exists():
+            registry_age = datetime.now() - datetime.fromtimestamp(
+                registry_filename.stat().st_mtime
+            )
+            stale = refresh or registry_age > ttl
+        else:
+            stale = True
+
+        if stale:
+            try:
+                if registry_filename.exists():
+                    previous_registry = read_station_registry(registry_filename)
+                else:
+                    previous_registry = None
+
+                # the previous registry is only replaced once a new one has been built successfully
+                write_station_registry(
+                    build_station_registry(previous_registry=previous_registry), registry_filename
+                )
+            except Exception as error:
+                if not registry_filename.exists():
+                    raise PyOFS.NoDataError(f'could not build NDBC station registry: {error}')
+                LOGGER.warning(
+                    f'using stale NDBC station registry: {error.__class__.__name__}: {error}'
+                )
+
+                # the failed attempt restarts the TTL, so the catalog is not crawled again on every call
+                try:
+                    registry_filename.touch()
+                except OSError as touch_error:
+                    LOGGER.warning(
+                        f'could not touch NDBC station registry: {touch_error.__class__.__name__}: {touch_error}'
+                    )
+
+        return read_station_registry(registry_filename)
+
+
+def build_station_registry(
+    station_names: [str] = None, previous_registry: [dict] = None
+) -> [dict]:
+    """
+    Read metadata of the given stations concurrently.
+
+    :param station_names: list of station names; defaults to all stations in the catalog
+    :param previous_registry: station entries to keep for stations whose metadata cannot be read
+    :return: list of station entries
+    :raises NoDataError: if no station entries could be read
+    """
+
+    if station_names is None:
+        station_names = catalog_station_names()
+
+    LOGGER.info(f'Building NDBC station registry from {len(station_names)} stations...')
+
+    if previous_registry is not None:
+        previous_stations = {station['name']: station for station in previous_registry}
+    else:
+        previous_stations = {}
+
+    registry = []
+    num_read = 0
+
+    with futures.ThreadPoolExecutor(MAX_CONCURRENT_STATIONS) as concurrency_pool:
+        running_futures = {
+            concurrency_pool.submit(read_station_metadata, station_name): station_name
+            for station_name in station_names
+        }
+
+        for completed_future in futures.as_completed(running_futures):
+            station_name = running_futures[completed_future]
+
+            if completed_future.exception() is None:
+                registry.append(completed_future.result())
+                num_read += 1
+            else:
+                LOGGER.debug(f'{completed_future.exception()}')
+
+                if station_name in previous_stations:
+                    registry.append(previous_stations[station_name])
+
+    if num_read == 0:
+        raise PyOFS.NoDataError(
+            f'could not read metadata of any of {len(station_names)} NDBC stations'
+        )
+
+    return sorted(registry, key=lambda station: station['name'])
+
+
+def write_station_registry(registry: [dict], registry_filename: PathLike):
+    """
+    Write station registry to a CSV file.
+
+    :param registry: list of station entries
+    :param registry_filename: path to registry CSV file
+    """
+
+    def write(filename: Path):
+        with open(filename, 'w', newline='') as registry_file:
+            writer = csv.DictWriter(registry_file, fieldnames=STATION_REGISTRY_FIELDS)
+            writer.writeheader()
+            for station in registry:
+                writer.writerow(
+                    {
+                        **station,
+                        'variables': ' '.join(station['variables']),
+                        'last_updated': f'{station["last_updated"]:%Y-%m-%dT%H:%M:%S}',
+                    }
+                )
+
+    utilities.write_atomically(registry_filename, write)
+
+
+def read_station_registry(registry_filename: PathLike) -> [dict]:
+    """
+    Read station registry from a CSV file.
+
+    :param registry_filename: path to registry CSV file
+    :return: list of station entries
+    """
+
+    with open(registry_filename, newline='') as registry_file:
+        return [
+            {
+                'name': row['name'],
+                'lon': float(row['lon']),
+                'lat': float(row['lat']),
+                'variables': row['variables'].split(),
+                'last_updated': datetime.strptime(row['last_updated'], '%Y-%m-%dT%H:%M:%S'),
+            }
+            for row in csv.DictReader(registry_file)
+        ]
+
+
+def study_area(study_area_polygon_filename: PathLike = STUDY_AREA_POLYGON_FILENAME):
+    """
+    Get prepared study area geometry, read from the given vector file only once per process.
 
-    :param dataset: NetCDF Dataset
     :param study_area_polygon_filename: vector file containing study area boundary
-    :return: whether station is within study area
+    :return: prepared shapely geometry
     """
 
-    if not isinstance(study_area_polygon_filename, Path):
-        study_area_polygon_filename = Path(study_area_polygon_filename)
+    return utilities.get_first_geometry(study_area_polygon_filename).geometry
+
 
-    # construct polygon from the first record in the layer
-    study_area_polygon = shapely.geometry.Polygon(
-        utilities.get_first_record(study_area_polygon_filename)['geometry']['coordinates'][0]
+def check_stations(
+    lon: [float], lat: [float], study_area_polygon_filename: PathLike = STUDY_AREA_POLYGON_FILENAME
+) -> numpy.array:
+    """
+    Check which of the given station coordinates lie within the study area.
+
+    :param lon: longitudes of stations
+    :param lat: latitudes of stations
+    :param study_area_polygon_filename: vector file containing study area boundary
+    :return: boolean array of whether each station is within study area
+    """
+
+    return shapely.intersects_xy(
+        study_area(study_area_polygon_filename),
+        numpy.asarray(lon, dtype=float),
+        numpy.asarray(lat, dtype=float),
     )
 
-    lon = dataset['longitude'][:]
-    lat = dataset['latitude'][:]
 
-    point = shapely.geometry.point.Point(lon, lat)
+def stations_within(
+    station_names: [str],
+    lon: [float],
+    lat: [float],
+    study_area_polygon_filename: PathLike = STUDY_AREA_POLYGON_FILENAME,
+) -> [str]:
+    """
+    Get names of the given stations that are located within the study area.
+
+    :param station_names: list of station names
+    :param lon: longitudes of stations
+    :param lat: latitudes of stations
+    :param study_area_polygon_filename: vector file containing study area boundary
+    :return: list of station names within study area
+    """
+
+    within = check_stations(lon, lat, study_area_polygon_filename)
+
+    return [station_name for station_name, inside in zip(station_names, within) if inside]
+
+
+def check_station(dataset: xarray.Dataset, study_area_polygon_filename: PathLike) -> bool:
+    """
+    Check whether station exists within the given study area.
+
+    :param dataset: NetCDF Dataset
+    :param study_area_polygon_filename: vector file containing study area boundary
+    :return: whether station is within study area
+    """
+
+    lon = dataset['longitude'].values.ravel()
+    lat = dataset['latitude'].values.ravel()
 
-    return point.intersects(study_area_polygon)
+    return bool(check_stations(lon, lat, study_area_polygon_filename).any())
 
 
 if __name__ == '__main__':
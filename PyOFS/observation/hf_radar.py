@@ -1,6 +1,8 @@
 from datetime import datetime, timedelta
+from functools import partial
 from os import PathLike
 from pathlib import Path
+import threading
 from typing import Collection
 
 import fiona
@@ -8,11 +10,18 @@ import fiona.crs
 import numpy
 import rasterio
 from rasterio.enums import Resampling
-import scipy.interpolate
 import xarray
 
 import PyOFS
-from PyOFS import CRS_EPSG, LEAFLET_NODATA_VALUE, TIFF_CREATION_OPTIONS, get_logger
+from PyOFS import (
+    CRS_EPSG,
+    DATA_DIRECTORY,
+    LEAFLET_NODATA_VALUE,
+    OBSERVATION_DTYPE,
+    TIFF_CREATION_OPTIONS,
+    get_logger,
+    utilities,
+)
 
 LOGGER = get_logger('PyOFS.HFR')
 
@@ -22,6 +31,18 @@ OUTPUT_CRS = fiona.crs.from_epsg(CRS_EPSG)
 
 NRT_DELAY = timedelta(hours=1)
 
+# local archive of hourly observations, one NetCDF file per source, resolution, and day
+ARCHIVE_DIRECTORY = DATA_DIRECTORY / 'input' / 'hfr'
+ARCHIVE_VARIABLES = list(DATA_VARIABLES.values()) + [
+    'site_code',
+    'site_netCode',
+    'site_lon',
+    'site_lat',
+]
+# hours still missing from every source this long after observation are archived as unobserved
+ARCHIVE_FINAL_DELAY = timedelta(days=1)
+_ARCHIVE_LOCK = threading.Lock()
+
 # either UCSD (University of California San Diego) or NDBC (National Data Buoy Center); NDBC has larger extent but only for the past 4 days
 SOURCE_URLS = {
     'NDBC': 'https://dods.ndbc.noaa.gov/thredds/dodsC',
@@ -36,8 +57,20 @@ class HFRadarRange:
 
     grid_transform = None
 
+    # nearest-neighbor mappings onto square cells, keyed by resolution and source grid
+    square_grids = {}
+
+    # radar facility tables, keyed by source URL
+    site_tables = {}
+    _site_tables_lock = threading.Lock()
+
     def __init__(
-        self, start_time: datetime = None, end_time: datetime = None, resolution: int = 6
+        self,
+        start_time: datetime = None,
+        end_time: datetime = None,
+        resolution: int = 6,
+        dtype: numpy.dtype = OBSERVATION_DTYPE,
+        use_archive: bool = True,
     ):
         """
         Creates new observation object from source.
@@ -45,6 +78,8 @@ class HFRadarRange:
         :param start_time: beginning of time interval
         :param end_time: end of time interval
         :param resolution: desired observation resolution in kilometers
+        :param dtype: floating point type of decoded and averaged data
+        :param use_archive: whether to read from the local archive first and archive newly retrieved hours
         :raises NoDataError: if observation does not exist.
         """
 
@@ -63,38 +98,123 @@ class HFRadarRange:
             self.end_time = end_time
 
         self.resolution = resolution
+        self.dtype = numpy.dtype(dtype)
 
-        # NDBC only keeps observations within the past 4 days
-        for source, source_url in SOURCE_URLS.items():
-            # get URL
-            if source == 'NDBC':
-                url = f'{source_url}/hfradar_uswc_{self.resolution}km'
-            elif source == 'UCSD':
-                url = f'{source_url}/{self.resolution}km/hourly/RTV/HFRADAR_US_West_Coast_{self.resolution}km_Resolution_Hourly_RTV_best.ncd'
-            else:
-                url = source_url
+        # packed DOP masks, keyed by threshold and time interval
+        self._dop_masks = {}
 
-            try:
-                self.dataset = xarray.open_dataset(url)
-                self.url = url
+        # hours of the time interval that should be available
+        first_hour = numpy.datetime64(self.start_time, 'h')
+        if first_hour < numpy.datetime64(self.start_time):
+            first_hour += numpy.timedelta64(1, 'h')
+        requested_hours = numpy.arange(
+            first_hour, numpy.datetime64(self.end_time, 'h') + 1, numpy.timedelta64(1, 'h')
+        )
+
+        self.url = None
+
+        # observations of requested hours from each source, in order of preference, along with their URLs
+        source_datasets = []
+        remote_datasets = {}
+        source_failed = False
+        missing_hours = requested_hours
+
+        # NDBC only keeps observations within the past 4 days, so fall back to UCSD for whatever hours are still missing
+        for source in SOURCE_URLS:
+            if len(missing_hours) == 0:
                 break
+
+            if use_archive:
+                archived_dataset = read_archive(missing_hours, source, self.resolution)
+                if archived_dataset is not None:
+                    source_datasets.append(
+                        (
+                            archive_directory(source, self.resolution).resolve().as_uri(),
+                            archived_dataset,
+                        )
+                    )
+                    missing_hours = missing_hours[
+                        ~numpy.isin(
+                            missing_hours, archived_dataset['time'].values.astype('datetime64[h]')
+                        )
+                    ]
+                    if len(missing_hours) == 0:
+                        break
+
+            url = source_url(source, self.resolution)
+
+            try:
+                remote_dataset = xarray.open_dataset(url)
             except OSError as error:
-                LOGGER.warning(f'{error.__class__.__name__}: {error}')
-        else:
+                LOGGER.warning(f'{source}: {error.__class__.__name__}: {error}')
+                source_failed = True
+                continue
+
+            remote_times = remote_dataset['time'].values.astype('datetime64[h]')
+            remote_dataset['time'] = xarray.DataArray(
+                remote_times,
+                coords=remote_dataset['time'].coords,
+                dims=remote_dataset['time'].dims,
+                attrs=remote_dataset['time'].attrs,
+            )
+            remote_datasets[source] = remote_dataset
+
+            available_hours = missing_hours[numpy.isin(missing_hours, remote_times)]
+            if len(available_hours) == 0:
+                continue
+
+            if use_archive:
+                append_archive(remote_dataset, available_hours, source, self.resolution)
+                source_datasets.append(
+                    (
+                        archive_directory(source, self.resolution).resolve().as_uri(),
+                        read_archive(available_hours, source, self.resolution),
+                    )
+                )
+            else:
+                source_datasets.append(
+                    (url, remote_dataset.isel(time=numpy.isin(remote_times, available_hours)))
+                )
+
+            missing_hours = missing_hours[~numpy.isin(missing_hours, available_hours)]
+
+        if use_archive and len(missing_hours) > 0:
+            if source_failed:
+                LOGGER.warning(
+                    f'{len(missing_hours)} HFR hours are missing while a source is unavailable; they will be requested again'
+                )
+            else:
+                # only hours that every source was asked for and did not return are final, and recorded in the archive of the preferred source
+                final_hours = missing_hours[
+                    missing_hours < numpy.datetime64(datetime.utcnow() - ARCHIVE_FINAL_DELAY, 'h')
+                ]
+                if len(final_hours) > 0:
+                    preferred_source = next(iter(SOURCE_URLS))
+                    append_archive(
+                        remote_datasets[preferred_source],
+                        final_hours,
+                        preferred_source,
+                        self.resolution,
+                    )
+
+        if len(source_datasets) == 0:
             raise PyOFS.NoDataError(
                 f'No HFR observations found between {self.start_time} and {self.end_time}'
             )
 
-        raw_times = self.dataset['time']
+        # the grid of the preferred source with observations is used for all hours
+        self.url, self.dataset = source_datasets[0]
+        if len(source_datasets) > 1:
+            self.dataset = combine_sources([dataset for _, dataset in source_datasets])
 
-        self.dataset['time'] = xarray.DataArray(
-            numpy.array(raw_times.values, dtype='datetime64[h]'),
-            coords=raw_times.coords,
-            dims=raw_times.dims,
-            attrs=raw_times.attrs,
-        )
+        if 'observed' in self.dataset:
+            # drop placeholders of hours that never arrived from any source
+            self.dataset = self.dataset.isel(time=self.dataset['observed'].values.astype(bool))
 
-        self.dataset = self.dataset.sel(time=slice(self.start_time, self.end_time))
+        if len(self.dataset['time']) == 0:
+            raise PyOFS.NoDataError(
+                f'No HFR observations found between {self.start_time} and {self.end_time}'
+            )
 
         LOGGER.info(
             f'Collecting HFR velocity between {str(self.dataset["time"].min().values)[:19]} and {str(self.dataset["time"].max().values)[:19]}...'
@@ -126,12 +246,14 @@ class HFRadarRange:
         :return: array of data.
         """
 
-        output_data = self.dataset[DATA_VARIABLES[variable]].sel(time)
+        output_data = numpy.array(
+            self.dataset[DATA_VARIABLES[variable]].sel(time=time).values, dtype=self.dtype
+        )
 
         if dop_threshold is not None:
-            output_data[~self.dop_mask(dop_threshold)] = numpy.nan
+            output_data[~self.dop_mask(dop_threshold, time, time)[0]] = numpy.nan
 
-        return output_data.values
+        return output_data
 
     def data_average(
         self,
@@ -152,25 +274,176 @@ class HFRadarRange:
         :return: array of data
         """
 
+        return self.data_averages(
+            [variable], start_time, end_time, dop_threshold, include_incomplete
+        )[variable]
+
+    def data_averages(
+        self,
+        variables: Collection[str],
+        start_time: datetime = None,
+        end_time: datetime = None,
+        dop_threshold: float = None,
+        include_incomplete: bool = False,
+    ) -> {str: numpy.array}:
+        """
+        Get time averages of the specified variables in a single pass over time, sharing a single DOP mask between them.
+
+        :param variables: variable names
+        :param start_time: start of time interval
+        :param end_time: end of time interval
+        :param dop_threshold: threshold for Dilution of Precision (DOP) above which data should be discarded
+        :param include_incomplete: whether to keep incomplete time series
+        :return: dictionary of arrays of data per variable
+        """
+
         if start_time is None:
             start_time = self.start_time
 
         if end_time is None:
             end_time = self.end_time
 
-        data_array = self.dataset[DATA_VARIABLES[variable]].sel(
-            time=slice(start_time, end_time)
-        )
+        if dop_threshold is not None:
+            dop_mask = self.dop_mask(dop_threshold, start_time, end_time)
+        else:
+            dop_mask = None
+
+        time_series = {
+            variable: self.dataset[DATA_VARIABLES[variable]]
+            .sel(time=slice(start_time, end_time))
+            .values
+            for variable in variables
+        }
+
+        return time_means(time_series, dop_mask, include_incomplete, self.dtype)
+
+    def rolling_averages(
+        self,
+        variables: Collection[str],
+        window_lengths: Collection[timedelta],
+        stride: timedelta = timedelta(hours=1),
+        start_time: datetime = None,
+        end_time: datetime = None,
+        dop_threshold: float = None,
+        include_incomplete: bool = False,
+    ) -> {timedelta: xarray.Dataset}:
+        """
+        Get rolling time averages of the specified variables for any number of window lengths.
+        Cumulative sums and counts of valid values are built once on a regular hourly axis, so each window mean is a difference of two cumulative slices.
+
+        :param variables: variable names
+        :param window_lengths: lengths of averaging windows (whole hours, e.g. 1, 6, 25 and 24 hours)
+        :param stride: time between the starts of consecutive windows (whole hours)
+        :param start_time: start of time interval
+        :param end_time: end of time interval
+        :param dop_threshold: threshold for Dilution of Precision (DOP) above which data should be discarded
+        :param include_incomplete: whether to keep cells with any missing or masked hour in the window
+        :return: dictionary of datasets of window means per window length, indexed by window start time
+        :raises ValueError: if the stride or a window length is not a positive whole number of hours
+        """
+
+        for duration in [stride, *window_lengths]:
+            if duration <= timedelta(0) or duration % timedelta(hours=1) != timedelta(0):
+                raise ValueError(f'stride and window lengths must be positive whole hours: {duration}')
+
+        if start_time is None:
+            start_time = self.start_time
+
+        if end_time is None:
+            end_time = self.end_time
+
+        hours = numpy.timedelta64(1, 'h')
+
+        times = self.dataset['time'].sel(time=slice(start_time, end_time)).values
+        times = times.astype('datetime64[h]')
+
+        if len(times) == 0:
+            raise PyOFS.NoDataError(f'No HFR observations found between {start_time} and {end_time}')
+
+        # place observed hours on a regular hourly axis from the first whole hour of the interval; hours without observations count as missing
+        first_hour = numpy.datetime64(start_time, 'h')
+        if first_hour < numpy.datetime64(start_time):
+            first_hour += hours
+        hourly_times = numpy.arange(first_hour, times[-1] + hours, hours)
+        time_indices = ((times - first_hour) // hours).astype(int)
 
         if dop_threshold is not None:
-            data_array.values[~self.dop_mask(dop_threshold)] = numpy.nan
+            dop_mask = self.dop_mask(dop_threshold, start_time, end_time)
+        else:
+            dop_mask = None
 
-        output_data = numpy.nanmean(data_array, axis=0)
+        grid_shape = (len(self.dataset['lat']), len(self.dataset['lon']))
 
-        if not include_incomplete:
-            output_data[numpy.isnan(data_array).any(axis=0)] = numpy.nan
+        cumulative_sums = {}
+        cumulative_counts = {}
 
-        return output_data
+        for variable in variables:
+            variable_data = (
+                self.dataset[DATA_VARIABLES[variable]].sel(time=slice(start_time, end_time)).values
+            )
+
+            # cumulative arrays with a leading zero slice, in double precision
+            variable_sums = numpy.zeros((len(hourly_times) + 1,) + grid_shape, dtype=numpy.float64)
+            variable_counts = numpy.zeros((len(hourly_times) + 1,) + grid_shape, dtype=numpy.int32)
+
+            for time_index, hourly_index in enumerate(time_indices):
+                values = variable_data[time_index]
+                valid = ~numpy.isnan(values)
+                if dop_mask is not None:
+                    valid &= dop_mask[time_index]
+
+                numpy.add(
+                    variable_sums[hourly_index + 1],
+                    values,
+                    out=variable_sums[hourly_index + 1],
+                    where=valid,
+                )
+                variable_counts[hourly_index + 1] += valid
+
+            numpy.cumsum(variable_sums, axis=0, out=variable_sums)
+            numpy.cumsum(variable_counts, axis=0, out=variable_counts)
+
+            cumulative_sums[variable] = variable_sums
+            cumulative_counts[variable] = variable_counts
+
+        stride_hours = stride // timedelta(hours=1)
+
+        output_datasets = {}
+
+        for window_length in window_lengths:
+            window_hours = window_length // timedelta(hours=1)
+            window_starts = numpy.arange(0, len(hourly_times) - window_hours + 1, stride_hours)
+
+            output_dataset = xarray.Dataset(
+                coords={
+                    'time': hourly_times[window_starts].astype('datetime64[ns]'),
+                    'lat': self.dataset['lat'],
+                    'lon': self.dataset['lon'],
+                },
+                attrs={'window_length_hours': window_hours, 'stride_hours': stride_hours},
+            )
+
+            for variable in variables:
+                window_sums = (
+                    cumulative_sums[variable][window_starts + window_hours]
+                    - cumulative_sums[variable][window_starts]
+                )
+                window_counts = (
+                    cumulative_counts[variable][window_starts + window_hours]
+                    - cumulative_counts[variable][window_starts]
+                )
+
+                window_means = numpy.full(window_sums.shape, numpy.nan, dtype=self.dtype)
+                numpy.divide(window_sums, window_counts, out=window_means, where=window_counts > 0)
+
+                if not include_incomplete:
+                    window_means[window_counts < window_hours] = numpy.nan
+
+                output_dataset[variable] = (('time', 'lat', 'lon'), window_means)
+
+            output_datasets[window_length] = output_dataset
+
+        return output_datasets
 
     def bounds(self) -> tuple:
         """
@@ -195,6 +468,28 @@ class HFRadarRange:
 
         return abs(self.mean_x_size), abs(self.mean_y_size)
 
+    def sites(self) -> {str: numpy.array}:
+        """
+        Get table of HFR radar facilities, read in bulk once per source.
+
+        :return: dictionary of site `code`, `net_code`, `lon` and `lat` arrays
+        """
+
+        with HFRadarRange._site_tables_lock:
+            if self.url not in HFRadarRange.site_tables:
+                site_variables = self.dataset[
+                    ['site_code', 'site_netCode', 'site_lon', 'site_lat']
+                ].load()
+
+                HFRadarRange.site_tables[self.url] = {
+                    'code': decode_strings(site_variables['site_code'].values),
+                    'net_code': decode_strings(site_variables['site_netCode'].values),
+                    'lon': site_variables['site_lon'].values.astype(float),
+                    'lat': site_variables['site_lat'].values.astype(float),
+                }
+
+            return HFRadarRange.site_tables[self.url]
+
     def write_sites(self, output_filename: PathLike):
         """
         Writes HFR radar facility locations to specified file and layer.
@@ -207,34 +502,18 @@ class HFRadarRange:
 
         output_filename, layer_name = PyOFS.split_layer_filename(output_filename)
 
-        layer_records = []
-
-        for site_index in range(self.dataset['nSites']):
-            site_code = (
-                self.dataset['site_code'][site_index].tobytes().decode().strip('\x00').strip()
-            )
-            site_network_code = (
-                self.dataset['site_netCode'][site_index]
-                    .tobytes()
-                    .decode()
-                    .strip('\x00')
-                    .strip()
-            )
-            lon = float(self.dataset['site_lon'][site_index])
-            lat = float(self.dataset['site_lat'][site_index])
-
-            record = {
-                'id': site_index + 1,
-                'geometry': {'type': 'Point', 'coordinates': (lon, lat)},
-                'properties': {
-                    'code': site_code,
-                    'net_code': site_network_code,
-                    'lon': float(lon),
-                    'lat': float(lat),
-                },
-            }
+        site_table = self.sites()
 
-            layer_records.append(record)
+        layer_records = point_records(
+            site_table['lon'],
+            site_table['lat'],
+            {
+                'code': site_table['code'],
+                'net_code': site_table['net_code'],
+                'lon': site_table['lon'],
+                'lat': site_table['lat'],
+            },
+        )
 
         schema = {
             'geometry': 'Point',
@@ -283,81 +562,61 @@ class HFRadarRange:
         if end_time is None:
             end_time = self.end_time
 
-        time_interval_selection = self.dataset.sel(time=slice(start_time, end_time))
+        if not isinstance(variables, dict):
+            variables = {variable: DATA_VARIABLES[variable] for variable in variables}
 
-        if dop_threshold is not None:
-            dop_mask = (
-                (self.dataset['dopx'].sel(time=slice(start_time, end_time)) <= dop_threshold)
-                & (self.dataset['dopy'].sel(time=slice(start_time, end_time)) <= dop_threshold)
-            ).values
-            time_interval_selection[~dop_mask] = numpy.nan
-
-        # create dict to store features
-        layers = {}
-
-        # create layer using OGR, then add features using QGIS
-        for hfr_time in time_interval_selection['time']:
-            hfr_time = datetime.utcfromtimestamp(
-                (hfr_time.values - numpy.datetime64('1970-01-01T00:00:00Z'))
-                / numpy.timedelta64(1, 's')
-            )
-            layer_name = f'{hfr_time:%Y%m%dT%H%M%S}'
-
-            hfr_data = time_interval_selection.sel(time=hfr_time)
+        time_interval_selection = self.dataset.sel(time=slice(start_time, end_time))
 
-            # create features
-            layer_records = []
+        # read each variable over the whole interval once, as (time, lat, lon) cubes
+        variable_data = {
+            variable: numpy.array(time_interval_selection[variable_name].values, dtype=self.dtype)
+            for variable, variable_name in variables.items()
+        }
 
-            feature_index = 1
+        if dop_threshold is not None:
+            dop_mask = self.dop_mask(dop_threshold, start_time, end_time)
+            for data in variable_data.values():
+                data[~dop_mask] = numpy.nan
 
-            for col in range(len(self.dataset['lon'])):
-                for row in range(len(self.dataset['lat'])):
-                    data = [
-                        float(hfr_data[variable_name][row, col].values)
-                        for variable, variable_name in variables.items()
-                    ]
+        # flatten grid column by column, matching the original feature order
+        lon, lat = numpy.meshgrid(self.dataset['lon'].values, self.dataset['lat'].values)
+        lon = lon.ravel(order='F')
+        lat = lat.ravel(order='F')
 
-                    # stop if record has masked values
-                    if not (numpy.isnan(data)).all():
-                        lon = self.dataset['lon'][col]
-                        lat = self.dataset['lat'][row]
+        schema = {'geometry': 'Point', 'properties': {'lon': 'float', 'lat': 'float'}}
+        schema['properties'].update({variable: 'float' for variable in variables})
 
-                        record = {
-                            'id': feature_index,
-                            'geometry': {'type': 'Point', 'coordinates': (lon, lat)},
-                            'properties': {'lon': float(lon), 'lat': float(lat)},
-                        }
+        hfr_times = time_interval_selection['time'].values.astype('datetime64[s]').astype(datetime)
 
-                        record['properties'].update(dict(zip(list(variables.keys()), data)))
+        LOGGER.info(f'Writing {len(hfr_times)} hourly layers to {output_filename}')
 
-                        layer_records.append(record)
-                        feature_index += 1
+        # avoid a journal write and sync per layer
+        with fiona.Env(OGR_SQLITE_JOURNAL='MEMORY', OGR_SQLITE_SYNCHRONOUS='OFF'):
+            for time_index, hfr_time in enumerate(hfr_times):
+                hourly_data = {
+                    variable: data[time_index].ravel(order='F')
+                    for variable, data in variable_data.items()
+                }
 
-            layers[layer_name] = layer_records
+                # skip cells where every variable is masked
+                valid = ~numpy.all(
+                    numpy.isnan(numpy.stack(list(hourly_data.values()))), axis=0
+                )
 
-        # write queued features to their respective layers
-        schema = {
-            'geometry': 'Point',
-            'properties': {
-                'u': 'float',
-                'v': 'float',
-                'lat': 'float',
-                'lon': 'float',
-                'dop_lat': 'float',
-                'dop_lon': 'float',
-            },
-        }
+                properties = {'lon': lon[valid], 'lat': lat[valid]}
+                properties.update(
+                    {variable: data[valid] for variable, data in hourly_data.items()}
+                )
 
-        for layer_name, layer_records in layers.items():
-            with fiona.open(
-                output_filename,
-                'w',
-                'GPKG',
-                layer=layer_name,
-                schema=schema,
-                crs=OUTPUT_CRS.to_dict(),
-            ) as layer:
-                layer.writerecords(layer_records)
+                with fiona.open(
+                    output_filename,
+                    'w',
+                    'GPKG',
+                    layer=f'{hfr_time:%Y%m%dT%H%M%S}',
+                    schema=schema,
+                    crs=OUTPUT_CRS.to_dict(),
+                ) as layer:
+                    layer.writerecords(point_records(lon[valid], lat[valid], properties))
 
     def write_vector(
         self,
@@ -366,6 +625,7 @@ class HFRadarRange:
         start_time: datetime = None,
         end_time: datetime = None,
         dop_threshold: float = 0.5,
+        flatgeobuf: bool = False,
     ):
         """
         Write average of HFR data for all hours in the given time interval to a single layer of the provided output file.
@@ -375,6 +635,7 @@ class HFRadarRange:
         :param start_time: beginning of time interval
         :param end_time: end of time interval
         :param dop_threshold: threshold for Dilution of Precision (DOP) above which data should be discarded
+        :param flatgeobuf: whether to also write the layer to a FlatGeobuf file next to the output file
         """
 
         if not isinstance(output_filename, Path):
@@ -387,40 +648,31 @@ class HFRadarRange:
         if variables is None:
             variables = DATA_VARIABLES
 
-        variable_means = {
-            variable: self.data_average(variable, start_time, end_time, dop_threshold)
-            for variable in variables
-        }
+        variable_means = self.data_averages(variables, start_time, end_time, dop_threshold)
 
         # define layer schema
         schema = {'geometry': 'Point', 'properties': {'lon': 'float', 'lat': 'float'}}
 
         schema['properties'].update({variable: 'float' for variable in variables})
 
-        # create features
-        layer_records = []
-
-        feature_index = 1
+        # flatten grid column by column and keep cells where any variable has data
+        lon, lat = numpy.meshgrid(self.dataset['lon'].values, self.dataset['lat'].values)
+        lon = lon.ravel(order='F')
+        lat = lat.ravel(order='F')
 
-        for col in range(len(self.dataset['lon'])):
-            for row in range(len(self.dataset['lat'])):
-                data = [float(variable_means[variable][row, col]) for variable in variables]
-
-                # stop if record has masked values
-                if not (numpy.isnan(data)).all():
-                    lon = self.dataset['lon'][col]
-                    lat = self.dataset['lat'][row]
+        variable_means = {
+            variable: variable_mean.ravel(order='F')
+            for variable, variable_mean in variable_means.items()
+        }
 
-                    record = {
-                        'id': feature_index,
-                        'geometry': {'type': 'Point', 'coordinates': (lon, lat)},
-                        'properties': {'lon': float(lon), 'lat': float(lat)},
-                    }
+        valid = ~numpy.all(numpy.isnan(numpy.stack(list(variable_means.values()))), axis=0)
 
-                    record['properties'].update(dict(zip(variables, data)))
+        properties = {'lon': lon[valid], 'lat': lat[valid]}
+        properties.update(
+            {variable: variable_mean[valid] for variable, variable_mean in variable_means.items()}
+        )
 
-                    layer_records.append(record)
-                    feature_index += 1
+        layer_records = point_records(lon[valid], lat[valid], properties)
 
         # write queued features to layer
         LOGGER.info(f'Writing {output_filename}')
@@ -434,6 +686,19 @@ class HFRadarRange:
         ) as layer:
             layer.writerecords(layer_records)
 
+        if flatgeobuf:
+            flatgeobuf_filename = output_filename.parent / f'{output_filename.stem}_{layer_name}.fgb'
+
+            LOGGER.info(f'Writing {flatgeobuf_filename}')
+            with fiona.open(
+                flatgeobuf_filename,
+                'w',
+                'FlatGeobuf',
+                schema=schema,
+                crs=OUTPUT_CRS.to_dict(),
+            ) as layer:
+                layer.writerecords(layer_records)
+
     def write_rasters(
         self,
         output_dir: PathLike,
@@ -469,22 +734,28 @@ class HFRadarRange:
         if filename_suffix is not '':
             filename_suffix = f'_{filename_suffix}'
 
-        variable_means = {
-            variable: self.data_average(variable, start_time, end_time, dop_threshold)
-            for variable in variables
-            if variable not in ['dir', 'mag']
-        }
+        average_variables = [
+            variable for variable in variables if variable not in ['dir', 'mag']
+        ]
 
         if 'dir' in variables or 'mag' in variables:
-            if 'ssu' in variables:
-                u_data = variable_means['ssu']
-            else:
-                u_data = self.data_average('ssu', start_time, end_time, dop_threshold)
+            average_variables.extend(
+                variable for variable in ['ssu', 'ssv'] if variable not in average_variables
+            )
 
-            if 'ssv' in variables:
-                v_data = variable_means['ssv']
-            else:
-                v_data = self.data_average('ssv', start_time, end_time, dop_threshold)
+        variable_means = self.data_averages(
+            average_variables, start_time, end_time, dop_threshold
+        )
+
+        if 'dir' in variables or 'mag' in variables:
+            u_data = variable_means['ssu']
+            v_data = variable_means['ssv']
+
+            # components only requested for direction and magnitude are not written
+            if 'ssu' not in variables:
+                del variable_means['ssu']
+            if 'ssv' not in variables:
+                del variable_means['ssv']
 
             # calculate direction and magnitude of vector in degrees (0-360) and in metres per second
             variable_means['dir'] = (numpy.arctan2(u_data, v_data) + numpy.pi) * (
@@ -508,33 +779,16 @@ class HFRadarRange:
             if driver == 'AAIGrid':
                 file_extension = 'asc'
 
-                # interpolate to regular grid in case of ASCII grid
-                mean_cell_length = numpy.min(self.cell_size())
-                west, north, east, south = self.bounds()
-
-                input_lon, input_lat = numpy.meshgrid(self.dataset['lon'], self.dataset['lat'])
-                output_lon = numpy.arange(west, east, mean_cell_length)[None, :]
-                output_lat = numpy.arange(south, north, mean_cell_length)[:, None]
-
-                raster_data = scipy.interpolate.griddata(
-                    (input_lon.flatten(), input_lat.flatten()),
-                    raster_data.flatten(),
-                    (output_lon, output_lat),
-                    method='nearest',
-                    fill_value=fill_value,
-                ).astype(raster_data.dtype)
+                # resample to square cells in case of ASCII grid
+                lat_indices, lon_indices, square_transform = self.square_grid()
+                raster_data = raster_data[lat_indices[:, None], lon_indices[None, :]]
 
                 gdal_args.update(
                     {
                         'height': raster_data.shape[0],
                         'width': raster_data.shape[1],
                         'FORCE_CELLSIZE': 'YES',
-                        'transform': rasterio.transform.from_origin(
-                            numpy.min(output_lon),
-                            numpy.max(output_lat),
-                            numpy.max(numpy.diff(output_lon)),
-                            numpy.max(numpy.diff(output_lon)),
-                        ),
+                        'transform': square_transform,
                     }
                 )
             elif driver == 'GPKG':
@@ -559,11 +813,44 @@ class HFRadarRange:
                     )
                     output_raster.update_tags(ns='rio_overview', resampling='average')
 
+    def square_grid(self) -> (numpy.array, numpy.array, rasterio.Affine):
+        """
+        Get nearest-neighbor mapping of the HFR grid onto a grid of square cells, computed once per resolution and source grid.
+        Both grids are rectilinear, so the nearest cell is found independently along each axis.
+
+        :return: indices into latitude and longitude of the HFR grid for each row and column of the square grid, and transform of the square grid
+        """
+
+        lat = self.dataset['lat'].values
+        lon = self.dataset['lon'].values
+        key = (self.resolution, lat.shape, lon.shape, float(lat[0]), float(lon[0]))
+
+        if key not in HFRadarRange.square_grids:
+            mean_cell_length = numpy.min(self.cell_size())
+            west, north, east, south = self.bounds()
+
+            output_lon = numpy.arange(west, east, mean_cell_length)
+            output_lat = numpy.arange(south, north, mean_cell_length)
+
+            HFRadarRange.square_grids[key] = (
+                nearest_indices(lat, output_lat),
+                nearest_indices(lon, output_lon),
+                rasterio.transform.from_origin(
+                    numpy.min(output_lon),
+                    numpy.max(output_lat),
+                    numpy.max(numpy.diff(output_lon)),
+                    numpy.max(numpy.diff(output_lon)),
+                ),
+            )
+
+        return HFRadarRange.square_grids[key]
+
     def dop_mask(
         self, threshold: float, start_time: datetime = None, end_time: datetime = None
     ):
         """
         Get mask of time series with a dilution of precision (DOP) below the given threshold.
+        Masks are computed once per threshold and time interval, and cached on the instance.
 
         :param threshold: DOP threshold
         :param start_time: start time
@@ -577,9 +864,18 @@ class HFRadarRange:
         if end_time is None:
             end_time = self.end_time
 
-        dop_x = self.dataset['dopx'].sel(time=slice(start_time, end_time))
-        dop_y = self.dataset['dopy'].sel(time=slice(start_time, end_time))
-        return ((dop_x <= threshold) & (dop_y <= threshold)).values
+        key = (threshold, start_time, end_time)
+
+        if key not in self._dop_masks:
+            dop_x = self.dataset['dopx'].sel(time=slice(start_time, end_time))
+            dop_y = self.dataset['dopy'].sel(time=slice(start_time, end_time))
+            mask = ((dop_x <= threshold) & (dop_y <= threshold)).values
+
+            # store packed to an eighth of the size of a boolean array
+            self._dop_masks[key] = numpy.packbits(mask, axis=None), mask.shape
+
+        packed_mask, shape = self._dop_masks[key]
+        return numpy.unpackbits(packed_mask, count=numpy.prod(shape)).reshape(shape).view(bool)
 
     def to_xarray(
         self,
@@ -612,14 +908,11 @@ class HFRadarRange:
             end_time = self.end_time
 
         if mean:
-            for variable in variables:
-                output_data = self.data_average(
-                    variable,
-                    start_time=start_time,
-                    end_time=end_time,
-                    dop_threshold=dop_threshold,
-                )
+            variable_means = self.data_averages(
+                variables, start_time=start_time, end_time=end_time, dop_threshold=dop_threshold
+            )
 
+            for variable, output_data in variable_means.items():
                 output_dataset.update(
                     {
                         variable: xarray.DataArray(
@@ -631,12 +924,16 @@ class HFRadarRange:
                 )
         else:
             for variable in variables:
-                output_data = self.dataset[DATA_VARIABLES[variable]].sel(
-                    time=slice(start_time, end_time)
+                output_data = (
+                    self.dataset[DATA_VARIABLES[variable]]
+                    .sel(time=slice(start_time, end_time))
+                    .astype(self.dtype)
                 )
 
                 if dop_threshold is not None:
-                    output_data.values[~self.dop_mask(dop_threshold)] = numpy.nan
+                    output_data.values[
+                        ~self.dop_mask(dop_threshold, start_time, end_time)
+                    ] = numpy.nan
 
                 output_dataset.update({variable: output_data})
 
@@ -678,6 +975,318 @@ class HFRadarRange:
         return f'{self.__class__.__name__}({str(", ".join(used_params))})'
 
 
+def source_url(source: str, resolution: int) -> str:
+    """
+    Get OpenDAP URL of HFR observations from the given source.
+
+    :param source: either `NDBC` or `UCSD`
+    :param resolution: observation resolution in kilometers
+    :return: URL
+    """
+
+    source_url = SOURCE_URLS[source]
+
+    if source == 'NDBC':
+        return f'{source_url}/hfradar_uswc_{resolution}km'
+    elif source == 'UCSD':
+        return f'{source_url}/{resolution}km/hourly/RTV/HFRADAR_US_West_Coast_{resolution}km_Resolution_Hourly_RTV_best.ncd'
+    else:
+        return source_url
+
+
+def archive_directory(source: str, resolution: int) -> Path:
+    """
+    Get directory of the local archive of HFR observations from the given source at the given resolution.
+    Sources are archived separately, since they do not share a grid.
+
+    :param source: either `NDBC` or `UCSD`
+    :param resolution: observation resolution in kilometers
+    :return: path to directory
+    """
+
+    return ARCHIVE_DIRECTORY / source.lower() / f'{resolution}km'
+
+
+def archive_filename(day: numpy.datetime64, source: str, resolution: int) -> Path:
+    """
+    Get path of the archived HFR observations of the given day.
+
+    :param day: day of observations
+    :param source: either `NDBC` or `UCSD`
+    :param resolution: observation resolution in kilometers
+    :return: path to daily NetCDF file
+    """
+
+    day = numpy.datetime64(day, 'D').astype(datetime)
+    return archive_directory(source, resolution) / f'hfr_{resolution}km_{day:%Y%m%d}.nc'
+
+
+def read_archive(hours: numpy.array, source: str, resolution: int) -> xarray.Dataset:
+    """
+    Read archived HFR hours, including placeholders of hours that never arrived from any source.
+
+    :param hours: hours to read (datetime64[h])
+    :param source: either `NDBC` or `UCSD`
+    :param resolution: observation resolution in kilometers
+    :return: dataset of archived hours, or None if none of the hours are archived
+    """
+
+    daily_datasets = []
+
+    for day in numpy.unique(hours.astype('datetime64[D]')):
+        filename = archive_filename(day, source, resolution)
+
+        if filename.exists():
+            with xarray.open_dataset(filename) as daily_dataset:
+                daily_times = daily_dataset['time'].values.astype('datetime64[h]')
+                daily_datasets.append(daily_dataset.isel(time=numpy.isin(daily_times, hours)).load())
+
+    daily_datasets = [
+        daily_dataset for daily_dataset in daily_datasets if len(daily_dataset['time']) > 0
+    ]
+
+    if len(daily_datasets) == 0:
+        return None
+
+    return xarray.concat(
+        daily_datasets, dim='time', data_vars='minimal', coords='minimal', compat='override'
+    )
+
+
+def append_archive(dataset: xarray.Dataset, hours: numpy.array, source: str, resolution: int):
+    """
+    Append the given hours of a source dataset to the daily files of the local archive of that source.
+    Hours absent from the dataset are archived as unobserved placeholders, so callers should only pass those once no source can provide them.
+
+    :param dataset: source dataset with an hourly time axis
+    :param hours: hours to archive (datetime64[h]), none of which are already archived
+    :param source: either `NDBC` or `UCSD`
+    :param resolution: observation resolution in kilometers
+    """
+
+    if len(hours) == 0:
+        return
+
+    source_hours = dataset['time'].values.astype('datetime64[h]')
+    variables = [variable for variable in ARCHIVE_VARIABLES if variable in dataset]
+
+    LOGGER.info(f'Archiving {len(hours)} HFR hours to {archive_directory(source, resolution)}')
+
+    for day in numpy.unique(hours.astype('datetime64[D]')):
+        daily_hours = hours[hours.astype('datetime64[D]') == day]
+        observed = numpy.isin(daily_hours, source_hours)
+
+        daily_dataset = (
+            dataset[variables]
+            .isel(time=numpy.isin(source_hours, daily_hours))
+            .load()
+            .reindex(time=daily_hours.astype(dataset['time'].dtype))
+        )
+        daily_dataset['observed'] = ('time', observed.astype(numpy.int8))
+
+        for variable in daily_dataset.variables.values():
+            variable.encoding = {}
+        encoding = {
+            variable: {'zlib': True}
+            for variable in DATA_VARIABLES.values()
+            if variable in daily_dataset
+        }
+
+        filename = archive_filename(day, source, resolution)
+
+        with _ARCHIVE_LOCK:
+            if filename.exists():
+                with xarray.open_dataset(filename) as archived_dataset:
+                    archived_dataset = archived_dataset.load()
+
+                # only add hours that are not archived yet
+                archived_hours = archived_dataset['time'].values.astype('datetime64[h]')
+                daily_dataset = daily_dataset.isel(
+                    time=~numpy.isin(daily_hours, archived_hours)
+                )
+
+                daily_dataset = xarray.concat(
+                    [archived_dataset, daily_dataset],
+                    dim='time',
+                    data_vars='minimal',
+                    coords='minimal',
+                    compat='override',
+                ).sortby('time')
+
+            utilities.write_atomically(
+                filename, partial(daily_dataset.to_netcdf, encoding=encoding)
+            )
+
+
+def combine_sources(datasets: [xarray.Dataset]) -> xarray.Dataset:
+    """
+    Combine hours from several sources on the grid of the first dataset.
+    Cells of the other grids are matched to the nearest cell within half a cell length; cells without a match are NaN.
+
+    :param datasets: datasets of distinct hours, in order of preference
+    :return: dataset of all hours on the grid of the first dataset
+    """
+
+    lat = datasets[0]['lat'].values
+    lon = datasets[0]['lon'].values
+    lat_tolerance = numpy.min(numpy.abs(numpy.diff(lat))) / 2
+    lon_tolerance = numpy.min(numpy.abs(numpy.diff(lon))) / 2
+
+    regridded_datasets = [datasets[0]]
+    for dataset in datasets[1:]:
+        # site tables differ between sources, so only time series are taken from other sources
+        dataset = dataset[
+            [variable for variable in dataset.data_vars if 'time' in dataset[variable].dims]
+        ]
+        regridded_datasets.append(
+            dataset.reindex(lat=lat, method='nearest', tolerance=lat_tolerance).reindex(
+                lon=lon, method='nearest', tolerance=lon_tolerance
+            )
+        )
+
+    return xarray.concat(
+        regridded_datasets,
+        dim='time',
+        data_vars='minimal',
+        coords='minimal',
+        compat='override',
+    ).sortby('time')
+
+
+def time_means(
+    time_series: {str: numpy.array},
+    mask: numpy.array = None,
+    include_incomplete: bool = False,
+    dtype: numpy.dtype = OBSERVATION_DTYPE,
+) -> {str: numpy.array}:
+    """
+    Average (time, lat, lon) arrays over time, accumulating sum and count of valid values in one traversal without modifying the inputs.
+
+    :param time_series: dictionary of arrays per variable, all of the same shape
+    :param mask: boolean array of the same shape, where false values are discarded
+    :param include_incomplete: whether to keep cells with any missing or masked time
+    :param dtype: floating point type of output
+    :return: dictionary of averages per variable, NaN where there is no (or incomplete) data
+    """
+
+    if len(time_series) == 0:
+        return {}
+
+    shape = numpy.shape(next(iter(time_series.values())))
+    num_times = shape[0]
+
+    # accumulate sums in double precision
+    sums = {variable: numpy.zeros(shape[1:], dtype=numpy.float64) for variable in time_series}
+    counts = {variable: numpy.zeros(shape[1:], dtype=numpy.int32) for variable in time_series}
+
+    for time_index in range(num_times):
+        for variable, variable_data in time_series.items():
+            values = variable_data[time_index]
+            valid = ~numpy.isnan(values)
+            if mask is not None:
+                valid &= mask[time_index]
+
+            numpy.add(sums[variable], values, out=sums[variable], where=valid)
+            counts[variable] += valid
+
+    output_data = {}
+
+    for variable in time_series:
+        variable_mean = numpy.full(shape[1:], numpy.nan, dtype=dtype)
+        numpy.divide(
+            sums[variable], counts[variable], out=variable_mean, where=counts[variable] > 0
+        )
+
+        if not include_incomplete:
+            variable_mean[counts[variable] < num_times] = numpy.nan
+
+        output_data[variable] = variable_mean
+
+    return output_data
+
+
+def nearest_indices(
+    input_coordinates: numpy.array, output_coordinates: numpy.array
+) -> numpy.array:
+    """
+    Get index of the nearest input coordinate to each output coordinate along a single axis.
+
+    :param input_coordinates: coordinates of input axis (in any order)
+    :param output_coordinates: coordinates of output axis
+    :return: array of indices into input coordinates
+    """
+
+    order = numpy.argsort(input_coordinates)
+    sorted_coordinates = numpy.asarray(input_coordinates)[order]
+
+    right = numpy.clip(
+        numpy.searchsorted(sorted_coordinates, output_coordinates), 1, len(sorted_coordinates) - 1
+    )
+    left = right - 1
+
+    nearest = numpy.where(
+        output_coordinates - sorted_coordinates[left]
+        <= sorted_coordinates[right] - output_coordinates,
+        left,
+        right,
+    )
+
+    return order[nearest]
+
+
+def decode_strings(values: numpy.array) -> numpy.array:
+    """
+    Decode an array of byte strings (or of single characters along its last axis) to stripped unicode strings.
+
+    :param values: array of byte strings or characters
+    :return: array of strings
+    """
+
+    values = numpy.asarray(values)
+
+    if values.dtype.kind == 'O':
+        values = values.astype(bytes)
+
+    if values.dtype.kind == 'S':
+        if values.dtype.itemsize == 1 and values.ndim > 1:
+            # join character arrays into fixed-width strings
+            values = numpy.ascontiguousarray(values).view(f'S{values.shape[-1]}')[..., 0]
+        values = numpy.char.decode(values, 'utf-8')
+
+    return numpy.char.strip(values, '\x00 ')
+
+
+def point_records(
+    lon: numpy.array, lat: numpy.array, properties: {str: numpy.array}, start_index: int = 1
+) -> [dict]:
+    """
+    Build point feature records from flattened coordinate and attribute columns.
+
+    :param lon: longitudes of points
+    :param lat: latitudes of points
+    :param properties: dictionary of attribute columns, each the same length as the coordinates
+    :param start_index: feature ID of the first record
+    :return: list of feature records
+    """
+
+    names = list(properties)
+    columns = [numpy.asarray(properties[name]).tolist() for name in names]
+
+    return [
+        {
+            'id': feature_index,
+            'geometry': {'type': 'Point', 'coordinates': (point_lon, point_lat)},
+            'properties': dict(zip(names, values)),
+        }
+        for feature_index, point_lon, point_lat, *values in zip(
+            range(start_index, start_index + len(lon)),
+            numpy.asarray(lon, dtype=float).tolist(),
+            numpy.asarray(lat, dtype=float).tolist(),
+            *columns,
+        )
+    ]
+
+
 def discard_incomplete_time_series(data: xarray.DataArray):
     assert 'time' in data.coords
 
@@ -1,5 +1,7 @@
 from collections import OrderedDict
-from datetime import datetime
+from datetime import datetime, timedelta
+from functools import partial
+import os
 from os import PathLike
 from pathlib import Path
 from typing import Collection
@@ -21,6 +23,7 @@ from PyOFS import (
     DATA_DIRECTORY,
     LEAFLET_NODATA_VALUE,
     NoDataError,
+    OBSERVATION_DTYPE,
     TIFF_CREATION_OPTIONS,
     get_logger,
     utilities,
@@ -32,6 +35,12 @@ STUDY_AREA_POLYGON_FILENAME = DATA_DIRECTORY / 'reference' / 'wcofs.gpkg:study_a
 
 OUTPUT_CRS = fiona.crs.from_epsg(CRS_EPSG)
 
+# local cache of study area subsets of monthly SSS
+CACHE_DIRECTORY = DATA_DIRECTORY / 'input' / 'smap'
+
+# how long a month that is not yet in the aggregation is not requested again
+UNPUBLISHED_MONTH_TTL = timedelta(hours=12)
+
 SOURCE_URLS = OrderedDict(
     {
         'OpenDAP': OrderedDict(
@@ -53,27 +62,65 @@ class SMAPDataset:
     study_area_bounds = None
     study_area_coordinates = None
 
-    def __init__(self, study_area_polygon_filename: PathLike = STUDY_AREA_POLYGON_FILENAME):
+    def __init__(
+        self,
+        study_area_polygon_filename: PathLike = STUDY_AREA_POLYGON_FILENAME,
+        dtype: numpy.dtype = OBSERVATION_DTYPE,
+        data_time: datetime = None,
+        use_cache: bool = True,
+    ):
         """
         Retrieve VIIRS NetCDF observation from NOAA with given datetime.
 
         :param study_area_polygon_filename: filename of vector file containing study area boundary
-        :raises NoDataError: if observation does not exist
+        :param dtype: floating point type of decoded data
+        :param data_time: month to retrieve; if given, reads the month from the local cache and only opens the remote aggregation when it is not cached yet
+        :param use_cache: whether to read and write the study area subset of the given month in the local cache
+        :raises NoDataError: if observation does not exist, or the given month was recently found to be unpublished
         """
 
         if not isinstance(study_area_polygon_filename, Path):
             study_area_polygon_filename = Path(study_area_polygon_filename)
 
         self.study_area_polygon_filename = study_area_polygon_filename
+        self.dtype = numpy.dtype(dtype)
 
-        for source, source_url in SOURCE_URLS['OpenDAP'].items():
-            try:
-                self.dataset = xarray.open_dataset(source_url)
-                break
-            except Exception as error:
-                LOGGER.warning(f'{error.__class__.__name__}: {error}')
+        self.data_time = data_time
+
+        if use_cache and data_time is not None:
+            cache_filename = month_cache_filename(data_time, self.study_area_polygon_filename)
+            unpublished_filename = cache_filename.with_suffix('.unpublished')
+        else:
+            cache_filename = None
+            unpublished_filename = None
+
+        if (
+            cache_filename is not None
+            and not cache_filename.exists()
+            and unpublished_filename.exists()
+        ):
+            checked_time = datetime.fromtimestamp(unpublished_filename.stat().st_mtime)
+            if datetime.now() - checked_time < UNPUBLISHED_MONTH_TTL:
+                raise NoDataError(
+                    f'SMAP month {data_time:%Y-%m} was not published as of {checked_time:%Y-%m-%d %H:%M}'
+                )
+
+        if cache_filename is not None and cache_filename.exists():
+            LOGGER.debug(f'Reading cached month {cache_filename}')
+            self.dataset = xarray.open_dataset(cache_filename)
+            self.url = cache_filename.resolve().as_uri()
+            cached = True
         else:
-            raise NoDataError(f'dataset creation error: no data found in sources')
+            for source, source_url in SOURCE_URLS['OpenDAP'].items():
+                try:
+                    self.dataset = xarray.open_dataset(source_url)
+                    self.url = source_url
+                    break
+                except Exception as error:
+                    LOGGER.warning(f'{error.__class__.__name__}: {error}')
+            else:
+                raise NoDataError(f'dataset creation error: no data found in sources')
+            cached = False
 
         # construct rectangular polygon of granule extent
         lon_min = float(self.dataset.geospatial_lon_min)
@@ -118,16 +165,10 @@ class SMAPDataset:
 
         if SMAPDataset.study_area_extent is None:
             # get first record in layer
-            SMAPDataset.study_area_extent = shapely.geometry.MultiPolygon(
-                [
-                    shapely.geometry.Polygon(polygon[0])
-                    for polygon in utilities.get_first_record(
-                    self.study_area_polygon_filename
-                )['geometry']['coordinates']
-                ]
-            )
+            study_area = utilities.get_first_geometry(self.study_area_polygon_filename)
 
-            SMAPDataset.study_area_bounds = SMAPDataset.study_area_extent.bounds
+            SMAPDataset.study_area_extent = study_area.geometry
+            SMAPDataset.study_area_bounds = study_area.bounds
             SMAPDataset.study_area_transform = rasterio.transform.from_origin(
                 SMAPDataset.study_area_bounds[0],
                 SMAPDataset.study_area_bounds[3],
@@ -145,6 +186,31 @@ class SMAPDataset:
                 ),
             )
 
+        # sorted time index for month lookups
+        times = self.dataset['times'].values.astype('datetime64[ns]')
+        self._time_order = numpy.argsort(times, kind='stable')
+        self._sorted_times = times[self._time_order]
+
+        if not cached and cache_filename is not None:
+            try:
+                time_index = self.time_index(data_time)
+            except NoDataError:
+                # remember that the month is not published yet, so that it is not requested again until the TTL expires
+                LOGGER.debug(f'SMAP month {data_time:%Y-%m} is not published yet')
+                try:
+                    os.makedirs(unpublished_filename.parent, exist_ok=True)
+                    unpublished_filename.touch()
+                except OSError as error:
+                    LOGGER.warning(
+                        f'could not record unpublished month: {error.__class__.__name__}: {error}'
+                    )
+            else:
+                write_cached_month(
+                    self.dataset[['smap_sss']].isel(times=[time_index]).load(), cache_filename
+                )
+                if unpublished_filename.exists():
+                    unpublished_filename.unlink()
+
         if SMAPDataset.study_area_coordinates is None:
             SMAPDataset.study_area_coordinates = {
                 'lon': self.dataset['longitude'],
@@ -185,22 +251,58 @@ class SMAPDataset:
 
         return output_data
 
-    def _sss(self, data_time: datetime) -> numpy.array:
+    def data_months(self, data_times: Collection[datetime], variable: str = 'sss') -> numpy.array:
         """
-        Retrieve SMOS SSS data.
+        Retrieve SMAP data of several months in a single read.
 
-        :param data_time: datetime to retrieve (only uses month)
-        :return: array of data
+        :param data_times: datetimes to retrieve (only uses month)
+        :param variable: SMAP variable to retrieve
+        :return: array of data of shape (month, lat, lon)
+        :raises NoDataError: if any of the months does not exist
+        """
+
+        if variable != 'sss':
+            return None
+
+        time_indices = [self.time_index(data_time) for data_time in data_times]
+
+        return numpy.array(
+            self.dataset['smap_sss'].isel(times=time_indices).values, dtype=self.dtype
+        )
+
+    def time_index(self, data_time: datetime) -> int:
+        """
+        Get position of the month of the given time along the time axis of the dataset.
+
+        :param data_time: datetime (only uses month)
+        :return: integer index of month
+        :raises NoDataError: if month does not exist
         """
 
-        # SMOS has data on month-long resolution
+        # SMAP has data on month-long resolution
         data_time = datetime(data_time.year, data_time.month, 16)
+        month = numpy.datetime64(data_time, 'ns')
 
-        if numpy.datetime64(data_time) in self.dataset['times'].values:
-            return self.dataset['smap_sss'].sel(times=data_time).values
+        sorted_index = numpy.searchsorted(self._sorted_times, month)
+
+        if sorted_index < len(self._sorted_times) and self._sorted_times[sorted_index] == month:
+            return int(self._time_order[sorted_index])
         else:
             raise PyOFS.NoDataError(f'No data exists for {data_time:%Y%m%dT%H%M%S}.')
 
+    def _sss(self, data_time: datetime) -> numpy.array:
+        """
+        Retrieve SMOS SSS data.
+
+        :param data_time: datetime to retrieve (only uses month)
+        :return: array of data
+        """
+
+        return numpy.array(
+            self.dataset['smap_sss'].isel(times=self.time_index(data_time)).values,
+            dtype=self.dtype,
+        )
+
     def write_rasters(
         self,
         output_dir: PathLike,
@@ -278,6 +380,39 @@ class SMAPDataset:
         return f'{self.__class__.__name__}({str(", ".join(used_params))})'
 
 
+def month_cache_filename(
+    data_time: datetime, study_area_polygon_filename: PathLike = STUDY_AREA_POLYGON_FILENAME
+) -> Path:
+    """
+    Get path of the cached study area subset of SMAP SSS in the month of the given time.
+
+    :param data_time: datetime (only uses month)
+    :param study_area_polygon_filename: filename of vector file containing study area boundary
+    :return: path to cached month
+    """
+
+    return (
+        utilities.study_area_cache_directory(CACHE_DIRECTORY, study_area_polygon_filename)
+        / f'smap_sss_{data_time:%Y%m}.nc'
+    )
+
+
+def write_cached_month(dataset: xarray.Dataset, cache_filename: PathLike):
+    """
+    Write study area subset of a month of SMAP SSS to the local cache.
+
+    :param dataset: cropped month
+    :param cache_filename: path to cached month
+    """
+
+    encoding = {variable_name: {'zlib': True} for variable_name in dataset.data_vars}
+
+    try:
+        utilities.write_atomically(cache_filename, partial(dataset.to_netcdf, encoding=encoding))
+    except Exception as error:
+        LOGGER.warning(f'could not cache month: {error.__class__.__name__}: {error}')
+
+
 if __name__ == '__main__':
     output_dir = DATA_DIRECTORY / 'output' / 'test'
 
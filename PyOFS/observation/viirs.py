@@ -1,14 +1,24 @@
+import asyncio
 from collections import OrderedDict
 from concurrent import futures
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+import errno
 import ftplib
-import math
+import functools
+import hashlib
+import io
 import os
 from os import PathLike
 from pathlib import Path
-from typing import Collection
+import queue
+import random
+import threading
+from typing import Collection, Iterator
+from urllib.parse import urlparse
 
 import fiona.crs
+import netCDF4
 import numpy
 import rasterio
 from rasterio.crs import CRS
@@ -24,6 +34,7 @@ from PyOFS import (
     CRS_EPSG,
     DATA_DIRECTORY,
     LEAFLET_NODATA_VALUE,
+    OBSERVATION_DTYPE,
     TIFF_CREATION_OPTIONS,
     get_logger,
     utilities,
@@ -41,6 +52,31 @@ OUTPUT_CRS = fiona.crs.from_epsg(CRS_EPSG)
 
 NRT_DELAY = timedelta(hours=2)
 
+# local cache of study area subsets of granules, evicted least recently used first beyond the size limit (in bytes)
+GRANULE_CACHE_DIRECTORY = DATA_DIRECTORY / 'input' / 'viirs' / 'granules'
+GRANULE_CACHE_SIZE_LIMIT = 2 * 1024 ** 3
+GRANULE_CACHE_VARIABLES = ['sea_surface_temperature', 'sses_bias']
+_GRANULE_CACHE_LOCK = threading.Lock()
+
+# politeness limits of remote granule requests
+MAX_REQUESTS_PER_HOST = 4
+MAX_CONCURRENT_GRANULES = 8
+GRANULE_FETCH_RETRIES = 2
+GRANULE_FETCH_BACKOFF = timedelta(seconds=2)
+# netCDF error codes that confirm a granule does not exist (NC_ENOTFOUND); any other error may be an outage
+GRANULE_NOT_FOUND_ERRORS = (errno.ENOENT, -90)
+_HOST_SEMAPHORES = {}
+_HOST_SEMAPHORES_LOCK = threading.Lock()
+
+# persisted state of incrementally updated composites
+COMPOSITE_STATE_DIRECTORY = DATA_DIRECTORY / 'input' / 'viirs' / 'composites'
+# granules still missing from every source this long after their pass are no longer requested for composites
+COMPOSITE_FINAL_DELAY = timedelta(days=1)
+
+# pass durations parsed from pass times files, keyed by filename and invalidated by modification time
+_PASS_TIMES_CACHE = {}
+_PASS_TIMES_LOCK = threading.Lock()
+
 SOURCE_URLS = OrderedDict(
     {
         'OpenDAP': OrderedDict(
@@ -55,6 +91,138 @@ SOURCE_URLS = OrderedDict(
 )
 
 
+class FTPSessionPool:
+    """
+    Pool of logged-in FTP sessions, bounded per host and reused across downloads.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 4,
+        timeout: float = 60,
+        keepalive_interval: timedelta = timedelta(seconds=30),
+    ):
+        """
+        Create an empty pool; sessions are opened on demand.
+
+        :param max_sessions: maximum number of concurrent sessions per host
+        :param timeout: socket timeout of sessions in seconds
+        :param keepalive_interval: idle time after which a session is checked with NOOP before being reused
+        """
+
+        self.max_sessions = max_sessions
+        self.timeout = timeout
+        self.keepalive_interval = keepalive_interval
+
+        self._lock = threading.Lock()
+        self._host_semaphores = {}
+        self._idle_sessions = {}
+
+    @contextmanager
+    def session(self, host: str) -> ftplib.FTP:
+        """
+        Borrow a logged-in session to the given host, waiting while the host is at its session limit.
+        Sessions that fail with a connection error are closed instead of being returned to the pool.
+
+        :param host: FTP host
+        :return: FTP session
+        """
+
+        with self._lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(self.max_sessions)
+                self._idle_sessions[host] = []
+            host_semaphore = self._host_semaphores[host]
+
+        with host_semaphore:
+            connection = self._connect(host)
+
+            try:
+                yield connection
+            except (EOFError, OSError, ftplib.error_temp, ftplib.error_reply, ftplib.error_proto):
+                self._close(connection)
+                raise
+            except:
+                self._release(host, connection)
+                raise
+            else:
+                self._release(host, connection)
+
+    def retrieve(self, host: str, path: str, retries: int = 1) -> bytes:
+        """
+        Download the given file into memory, reconnecting if a pooled session has been dropped by the server.
+
+        :param host: FTP host
+        :param path: path to file on host
+        :param retries: number of times to reconnect after a connection error
+        :return: file contents
+        """
+
+        for attempt in range(retries + 1):
+            buffer = io.BytesIO()
+
+            try:
+                with self.session(host) as connection:
+                    connection.retrbinary(f'RETR {path}', buffer.write)
+                return buffer.getvalue()
+            except (EOFError, OSError, ftplib.error_temp, ftplib.error_reply) as error:
+                if attempt >= retries:
+                    raise
+                LOGGER.debug(f'reconnecting to {host} after {error.__class__.__name__}: {error}')
+
+    def close(self):
+        """
+        Close all idle sessions.
+        """
+
+        with self._lock:
+            for host_sessions in self._idle_sessions.values():
+                for connection, _ in host_sessions:
+                    self._close(connection)
+                host_sessions.clear()
+
+    def _connect(self, host: str) -> ftplib.FTP:
+        while True:
+            with self._lock:
+                if len(self._idle_sessions[host]) == 0:
+                    break
+                connection, last_used = self._idle_sessions[host].pop()
+
+            if datetime.now() - last_used < self.keepalive_interval:
+                return connection
+
+            try:
+                connection.voidcmd('NOOP')
+                return connection
+            except (EOFError, OSError, ftplib.Error):
+                self._close(connection)
+
+        connection = ftplib.FTP(host, timeout=self.timeout)
+        connection.login()
+        return connection
+
+    def _release(self, host: str, connection: ftplib.FTP):
+        with self._lock:
+            self._idle_sessions[host].append((connection, datetime.now()))
+
+    @staticmethod
+    def _close(connection: ftplib.FTP):
+        try:
+            connection.quit()
+        except (EOFError, OSError, ftplib.Error):
+            connection.close()
+
+
+# FTP sessions shared by all granules
+FTP_SESSIONS = FTPSessionPool()
+
+
+class NoPassError(PyOFS.NoDataError):
+    """
+    granule can never provide data for the study area (no archive, or no overlap)
+    """
+
+
 class VIIRSDataset:
     """
     Visible Infrared Imaging Radiometer Suite (VIIRS) sea-surface temperature.
@@ -72,6 +240,8 @@ class VIIRSDataset:
         study_area_polygon_filename: PathLike = STUDY_AREA_POLYGON_FILENAME,
         algorithm: str = 'OSPO',
         version: str = None,
+        use_cache: bool = True,
+        dtype: numpy.dtype = OBSERVATION_DTYPE,
     ):
         """
         Retrieve VIIRS NetCDF observation from NOAA with given datetime.
@@ -81,6 +251,8 @@ class VIIRSDataset:
         :param study_area_polygon_filename: filename of vector file containing study area boundary
         :param algorithm: either 'STAR' or 'OSPO'
         :param version: ACSPO algorithm version
+        :param use_cache: whether to read and write the study area subset of the granule in the local granule cache
+        :param dtype: floating point type of decoded data
         :raises NoDataError: if observation does not exist
         """
 
@@ -101,174 +273,75 @@ class VIIRSDataset:
         self.near_real_time = datetime.now() - data_time <= timedelta(days=13)
         self.algorithm = algorithm
 
-        if version is None:
-            if data_time >= datetime(2019, 4, 23, 12, 50):
-                self.version = '2.61'
-            elif data_time >= datetime(2018, 11, 7, 15, 10):
-                self.version = '2.60'
-            elif data_time >= datetime(2017, 9, 14, 12, 50):
-                self.version = '2.41'
-            else:
-                self.version = '2.40'
-        else:
-            self.version = version
+        self.version = version if version is not None else default_version(self.data_time)
+        self.dtype = numpy.dtype(dtype)
 
         self.url = None
 
-        day_dir = f'{self.data_time.year}/{self.data_time.timetuple().tm_yday:03}'
-        filename = f'{self.data_time:%Y%m%d%H%M%S}-{self.algorithm}-L3U_GHRSST-SSTsubskin-VIIRS_{self.satellite.upper()}-ACSPO_V{self.version}-v02.0-fv01.0.nc'
+        # decoded and derived arrays, populated on first access
+        self._arrays = {}
+
+        if VIIRSDataset.study_area_extent is None:
+            # first record in layer, prepared for repeated intersection tests against granule extents
+            study_area = utilities.get_first_geometry(self.study_area_polygon_filename)
+
+            VIIRSDataset.study_area_bounds = study_area.bounds
+            VIIRSDataset.study_area_extent = study_area.geometry
 
         # TODO N20 does not yet have a reanalysis archive on NESDIS (as of March 8th, 2019)
         if self.satellite.upper() == 'N20' and not self.near_real_time:
-            raise PyOFS.NoDataError(
+            raise NoPassError(
                 f'{self.satellite.upper()} does not yet have a reanalysis archive'
             )
 
-        for source, source_url in SOURCE_URLS['OpenDAP'].items():
-            url = source_url
-
-            if self.near_real_time:
-                if source == 'NESDIS':
-                    url = f'{source_url}/grid{self.satellite.upper()}VIIRSNRTL3UWW00/{day_dir}/{filename}'
-                elif source == 'JPL':
-                    url = f'{source_url}/VIIRS_{self.satellite.upper()}/{algorithm}/v{self.version}/{day_dir}/{filename}'
-                elif source in 'NODC':
-                    url = f'{source_url}/VIIRS_{self.satellite.upper()}/{algorithm}/{day_dir}/{filename}'
-            else:
-                if source == 'NESDIS':
-                    url = f'{source_url}/grid{"" if self.near_real_time else "S"}{self.satellite.upper()}VIIRSSCIENCEL3UWW00/{day_dir}/{filename}'
-                else:
-                    LOGGER.warning(f'{source} does not contain a reanalysis archive')
-
-            try:
-                self.dataset = xarray.open_dataset(url)
-                self.url = url
-                break
-            except Exception as error:
-                LOGGER.warning(f'{error.__class__.__name__}: {error}')
-
-        if self.url is None:
-            LOGGER.warning('Error collecting from OpenDAP; falling back to FTP...')
-
-            for source, source_url in SOURCE_URLS['FTP'].items():
-                host_url, ftp_input_dir = source_url.split('/', 1)
-                ftp_path = ftp_input_dir
-                url = host_url
-
-                if source == 'NESDIS':
-                    if self.near_real_time:
-                        ftp_path = f'/{ftp_input_dir}/nrt/viirs/{self.satellite.lower()}/l3u/{day_dir}/{filename}'
-                    else:
-                        ftp_path = f'/{ftp_input_dir}/ran/viirs/{"S" if self.satellite.upper() == "NPP" else ""}{self.satellite.lower()}/l3u/{day_dir}/{filename}'
-
-                    url = f'{host_url}/{ftp_path.lstrip("/")}'
-
-                try:
-                    with ftplib.FTP(host_url) as ftp_connection:
-                        ftp_connection.login()
-
-                        output_dir = DATA_DIRECTORY / 'input' / 'viirs'
-
-                        if not output_dir.exists():
-                            os.makedirs(output_dir, exist_ok=True)
-
-                        output_filename = output_dir / f'viirs_{self.data_time:%Y%m%dT%H%M}.nc'
-
-                        if output_filename.exists():
-                            os.remove(output_filename)
-
-                        try:
-                            with open(output_filename, 'wb') as output_file:
-                                ftp_connection.retrbinary(
-                                    f'RETR {ftp_path}', output_file.write
-                                )
-                                self.dataset = xarray.open_dataset(output_filename)
-                        except:
-                            raise
-                        finally:
-                            os.remove(output_filename)
-
-                    self.url = url
-                    break
-                except Exception as error:
-                    LOGGER.warning(f'{error.__class__.__name__}: {error}')
+        if use_cache:
+            cache_filename = granule_cache_filename(
+                self.data_time,
+                self.satellite,
+                self.algorithm,
+                self.version,
+                self.study_area_polygon_filename,
+            )
+        else:
+            cache_filename = None
 
-                if self.url is not None:
-                    break
+        if cache_filename is not None and cache_filename.exists():
+            LOGGER.debug(f'Reading cached granule {cache_filename}')
+            self.dataset = xarray.open_dataset(cache_filename)
+            self.url = cache_filename.resolve().as_uri()
+            cached = True
 
-        if self.url is None:
-            raise PyOFS.NoDataError(f'No VIIRS observation found at {self.data_time} UTC.')
+            # mark granule as recently used
+            os.utime(cache_filename)
+        else:
+            self._open_remote()
+            cached = False
 
         # construct rectangular polygon of granule extent
-        if 'geospatial_bounds' in self.dataset.attrs:
-            self.data_extent = shapely.wkt.loads(self.dataset.geospatial_bounds)
-        elif 'geospatial_lon_min' in self.dataset.attrs:
-            lon_min = float(self.dataset.geospatial_lon_min)
-            lon_max = float(self.dataset.geospatial_lon_max)
-            lat_min = float(self.dataset.geospatial_lat_min)
-            lat_max = float(self.dataset.geospatial_lat_max)
-
-            if lon_min < lon_max:
-                self.data_extent = shapely.geometry.Polygon(
-                    [
-                        (lon_min, lat_max),
-                        (lon_max, lat_max),
-                        (lon_max, lat_min),
-                        (lon_min, lat_min),
-                    ]
-                )
-            else:
-                # geospatial bounds cross the antimeridian, so we create a multipolygon
-                self.data_extent = shapely.geometry.MultiPolygon(
-                    [
-                        shapely.geometry.Polygon(
-                            [
-                                (lon_min, lat_max),
-                                (180, lat_max),
-                                (180, lat_min),
-                                (lon_min, lat_min),
-                            ]
-                        ),
-                        shapely.geometry.Polygon(
-                            [
-                                (-180, lat_max),
-                                (lon_max, lat_max),
-                                (lon_max, lat_min),
-                                (-180, lat_min),
-                            ]
-                        ),
-                    ]
-                )
-        else:
-            LOGGER.warning(f'{self.data_time} UTC: Dataset has no stored bounds...')
+        self.data_extent = granule_extent(self.dataset.attrs)
 
-        lon_pixel_size = self.dataset.geospatial_lon_resolution
-        lat_pixel_size = self.dataset.geospatial_lat_resolution
+        if self.data_extent is None:
+            LOGGER.warning(f'{self.data_time} UTC: Dataset has no stored bounds...')
 
-        if VIIRSDataset.study_area_extent is None:
-            LOGGER.debug(
-                f'Calculating indices and transform from granule at {self.data_time} UTC...'
+        # skip granules that do not cover any of the study area before accessing data variables
+        if self.data_extent is not None and not overlaps_area(
+            self.data_extent, VIIRSDataset.study_area_extent
+        ):
+            raise NoPassError(
+                f'{self.data_time} UTC: {self.satellite.upper()} granule does not overlap the study area'
             )
 
-            # get first record in layer
-            VIIRSDataset.study_area_extent = shapely.geometry.MultiPolygon(
-                [
-                    shapely.geometry.Polygon(polygon[0])
-                    for polygon in utilities.get_first_record(
-                    self.study_area_polygon_filename
-                )['geometry']['coordinates']
-                ]
-            )
+        if VIIRSDataset.study_area_transform is None:
+            LOGGER.debug(f'Calculating transform from granule at {self.data_time} UTC...')
 
-            VIIRSDataset.study_area_bounds = VIIRSDataset.study_area_extent.bounds
             VIIRSDataset.study_area_transform = rasterio.transform.from_origin(
                 VIIRSDataset.study_area_bounds[0],
                 VIIRSDataset.study_area_bounds[3],
-                lon_pixel_size,
-                lat_pixel_size,
+                self.dataset.geospatial_lon_resolution,
+                self.dataset.geospatial_lat_resolution,
             )
 
-        if VIIRSDataset.study_area_bounds is not None:
+        if not cached:
             self.dataset = self.dataset.isel(time=0).sel(
                 lon=slice(
                     VIIRSDataset.study_area_bounds[0], VIIRSDataset.study_area_bounds[2]
@@ -278,12 +351,72 @@ class VIIRSDataset:
                 ),
             )
 
+            # transfer data variables while holding a request slot of the host, so that downloads are limited per host as well
+            with host_request_slot(self.url):
+                self.dataset = self.dataset[GRANULE_CACHE_VARIABLES].load()
+
+            if cache_filename is not None:
+                write_cached_granule(self.dataset, cache_filename)
+
         if VIIRSDataset.study_area_coordinates is None:
             VIIRSDataset.study_area_coordinates = {
                 'lon': self.dataset['lon'],
                 'lat': self.dataset['lat'],
             }
 
+    def _open_remote(self):
+        """
+        Open granule from the first available OpenDAP source, falling back to FTP.
+
+        :raises NoDataError: if granule does not exist in any source
+        :raises ConnectionError: if the FTP fallback could not be reached
+        """
+
+        for source, url in opendap_urls(
+            self.data_time, self.satellite, self.algorithm, self.version, self.near_real_time
+        ).items():
+            try:
+                with host_request_slot(url):
+                    self.dataset = xarray.open_dataset(url)
+                self.url = url
+                break
+            except Exception as error:
+                LOGGER.warning(f'{error.__class__.__name__}: {error}')
+
+        connection_error = None
+
+        if self.url is None:
+            LOGGER.warning('Error collecting from OpenDAP; falling back to FTP...')
+
+            for source, (host_url, ftp_path) in ftp_paths(
+                self.data_time, self.satellite, self.algorithm, self.version, self.near_real_time
+            ).items():
+                url = f'{host_url}/{ftp_path.lstrip("/")}'
+
+                try:
+                    # download granule into memory over a pooled session
+                    granule_bytes = FTP_SESSIONS.retrieve(host_url, ftp_path)
+                    self.dataset = xarray.open_dataset(
+                        xarray.backends.NetCDF4DataStore(
+                            netCDF4.Dataset(Path(ftp_path).name, memory=granule_bytes)
+                        )
+                    )
+                    self.url = url
+                    break
+                except Exception as error:
+                    LOGGER.warning(f'{error.__class__.__name__}: {error}')
+
+                    # a permanent FTP reply means the granule is missing, anything else may succeed on retry
+                    if not isinstance(error, ftplib.error_perm):
+                        connection_error = error
+
+        if self.url is None:
+            if connection_error is not None:
+                raise ConnectionError(
+                    f'Could not retrieve VIIRS observation at {self.data_time} UTC: {connection_error}'
+                ) from connection_error
+            raise PyOFS.NoDataError(f'No VIIRS observation found at {self.data_time} UTC.')
+
     def bounds(self) -> tuple:
         """
         Get coordinate bounds of observation.
@@ -302,19 +435,54 @@ class VIIRSDataset:
 
         return self.dataset.geospatial_lon_resolution, self.dataset.geospatial_lat_resolution
 
-    def data(self, variable: str = 'sst', correct_sses=True) -> numpy.array:
+    def data(
+        self, variable: str = 'sst', correct_sses: bool = True, copy: bool = False
+    ) -> numpy.array:
         """
-        Retrieve data of given variable. Use 'sst_sses' to retrieve SST corrected with sensor-specific error statistic (SSES)
+        Retrieve data of given variable. Arrays are decoded once per granule and returned read-only unless a copy is requested.
 
-        :param variable: variable name (one of 'sst', 'sses', or 'sst_sses')
+        :param variable: variable name (one of 'sst' or 'sses')
         :param correct_sses: whether to apply sensor bias
+        :param copy: whether to return a writable copy instead of the cached read-only array
         :return: matrix of data in Celsius
         """
 
         if variable == 'sst':
-            return self._sst(correct_sses)
+            key = (variable, correct_sses)
         elif variable == 'sses':
-            return self._sses()
+            key = (variable, None)
+        else:
+            return None
+
+        if key not in self._arrays:
+            output_data = self._sst(correct_sses) if variable == 'sst' else self._sses()
+            output_data.flags.writeable = False
+            self._arrays[key] = output_data
+
+        output_data = self._arrays[key]
+        return output_data.copy() if copy else output_data
+
+    def _variable(self, variable_name: str) -> numpy.array:
+        """
+        Return decoded values of the given granule variable, reading them only on first access.
+
+        :param variable_name: name of variable in granule
+        :return: read-only array of the dataset floating point type
+        """
+
+        if variable_name not in self._arrays:
+            variable_data = numpy.array(self.dataset[variable_name].values, dtype=self.dtype)
+            variable_data.flags.writeable = False
+            self._arrays[variable_name] = variable_data
+
+        return self._arrays[variable_name]
+
+    def release_arrays(self):
+        """
+        Discard decoded arrays of the granule; they are decoded again from the dataset on the next access.
+        """
+
+        self._arrays.clear()
 
     def _sst(self, correct_sses: bool = False) -> numpy.array:
         """
@@ -325,34 +493,31 @@ class VIIRSDataset:
         """
 
         # observation SST data (masked array) using vertically reflected VIIRS grid
-        output_sst_data = self.dataset['sea_surface_temperature'].values
+        sst_data = self._variable('sea_surface_temperature')
 
         # check for unmasked data
-        if not numpy.isnan(output_sst_data).all():
-            if numpy.nanmax(output_sst_data) > 0:
-                if numpy.nanmin(output_sst_data) <= 0:
-                    output_sst_data[output_sst_data <= 0] = numpy.nan
+        if numpy.isnan(sst_data).all():
+            return sst_data.copy()
 
-                if correct_sses:
-                    sses = self._sses()
+        # discard non-positive temperatures (in Kelvin)
+        output_sst_data = numpy.where(sst_data > 0, sst_data, self.dtype.type(numpy.nan))
 
-                    mismatched_records = len(
-                        numpy.where(numpy.isnan(output_sst_data) != (sses == 0))[0]
-                    )
-                    total_records = output_sst_data.shape[0] * output_sst_data.shape[1]
-                    mismatch_percentage = mismatched_records / total_records * 100
+        if correct_sses:
+            sses = self.data('sses')
 
-                    if mismatch_percentage > 0:
-                        LOGGER.warning(
-                            f'{self.data_time} UTC: SSES extent mismatch at {mismatch_percentage:.1f}%'
-                        )
+            mismatched_records = numpy.count_nonzero(numpy.isnan(output_sst_data) != (sses == 0))
+            total_records = output_sst_data.shape[0] * output_sst_data.shape[1]
+            mismatch_percentage = mismatched_records / total_records * 100
 
-                    output_sst_data -= sses
+            if mismatch_percentage > 0:
+                LOGGER.warning(
+                    f'{self.data_time} UTC: SSES extent mismatch at {mismatch_percentage:.1f}%'
+                )
 
-                # convert from Kelvin to Celsius (subtract 273.15)
-                output_sst_data -= 273.15
-            else:
-                output_sst_data[:] = numpy.nan
+            output_sst_data -= sses
+
+        # convert from Kelvin to Celsius (subtract 273.15)
+        output_sst_data -= self.dtype.type(273.15)
 
         return output_sst_data
 
@@ -364,15 +529,12 @@ class VIIRSDataset:
         """
 
         # observation bias values using vertically reflected VIIRS grid
-        sses_data = self.dataset['sses_bias'].values
+        sses_data = self._variable('sses_bias')
 
-        # replace masked values with 0
-        sses_data[numpy.isnan(sses_data)] = 0
-
-        # negative offset by 2.048
-        sses_data -= 2.048
-
-        return sses_data
+        # replace masked values with 0 and negative offset by 2.048
+        return numpy.where(numpy.isnan(sses_data), self.dtype.type(0), sses_data) - self.dtype.type(
+            2.048
+        )
 
     def write_rasters(
         self,
@@ -398,7 +560,7 @@ class VIIRSDataset:
             output_dir = Path(output_dir)
 
         for variable in variables:
-            input_data = self.data(variable, correct_sses)
+            input_data = self.data(variable, correct_sses, copy=True)
 
             if variable == 'sses':
                 fill_value = 0
@@ -477,6 +639,8 @@ class VIIRSRange:
         pass_times_filename: PathLike = PASS_TIMES_FILENAME,
         algorithm: str = 'OSPO',
         version: str = None,
+        use_cache: bool = True,
+        dtype: numpy.dtype = OBSERVATION_DTYPE,
     ):
         """
         Collect VIIRS datasets within time interval.
@@ -488,6 +652,8 @@ class VIIRSRange:
         :param pass_times_filename: path to text file with pass times
         :param algorithm: either 'STAR' or 'OSPO'
         :param version: ACSPO algorithm version
+        :param use_cache: whether to read and write study area subsets of granules in the local granule cache
+        :param dtype: floating point type of decoded and composited data
         :raises NoDataError: if data does not exist
         """
 
@@ -510,6 +676,8 @@ class VIIRSRange:
         self.viirs_pass_times_filename = pass_times_filename
         self.algorithm = algorithm
         self.version = version
+        self.use_cache = use_cache
+        self.dtype = numpy.dtype(dtype)
 
         self.pass_times = get_pass_times(
             self.start_time, self.end_time, self.viirs_pass_times_filename
@@ -523,32 +691,29 @@ class VIIRSRange:
             # create dictionary to store scenes
             self.datasets = {pass_time: {} for pass_time in self.pass_times}
 
-            with futures.ThreadPoolExecutor() as concurrency_pool:
-                for satellite in self.satellites:
-                    running_futures = {}
-
-                    for pass_time in self.pass_times:
-                        running_future = concurrency_pool.submit(
-                            VIIRSDataset,
-                            data_time=pass_time,
-                            study_area_polygon_filename=self.study_area_polygon_filename,
-                            algorithm=self.algorithm,
-                            version=self.version,
-                            satellite=satellite,
-                        )
-                        running_futures[running_future] = pass_time
+            # sums and counts of platforms per pass, merged as granules arrive
+            self._scenes = {variable: {} for variable in ('sst', 'sses')}
 
-                    for completed_future in futures.as_completed(running_futures):
-                        if completed_future.exception() is None:
-                            pass_time = running_futures[completed_future]
-                            viirs_dataset = completed_future.result()
-                            self.datasets[pass_time][satellite] = viirs_dataset
-                        else:
-                            LOGGER.warning(
-                                f'Dataset creation error: {completed_future.exception()}'
-                            )
+            # schedule every satellite and pass in a single queue
+            granules = [
+                (pass_time, satellite)
+                for pass_time in self.pass_times
+                for satellite in self.satellites
+            ]
 
-                    del running_futures
+            for pass_time, satellite, result in fetch_granules(
+                granules,
+                study_area_polygon_filename=self.study_area_polygon_filename,
+                algorithm=self.algorithm,
+                version=self.version,
+                use_cache=self.use_cache,
+                dtype=self.dtype,
+            ):
+                if isinstance(result, Exception):
+                    LOGGER.warning(f'Dataset creation error: {result}')
+                else:
+                    self.datasets[pass_time][satellite] = result
+                    self._merge_scenes(pass_time, result)
 
             if len(self.datasets) > 0:
                 VIIRSRange.study_area_transform = VIIRSDataset.study_area_transform
@@ -566,6 +731,31 @@ class VIIRSRange:
                 f'There are no VIIRS passes between {self.start_time} UTC and {self.end_time} UTC.'
             )
 
+    def _merge_scenes(self, pass_time: datetime, dataset: VIIRSDataset):
+        """
+        Add the uncorrected data of the given granule to the platform sums and counts of its pass.
+        The decoded arrays of the granule are released afterwards, so that only the merged pass is kept in memory.
+
+        :param pass_time: pass time
+        :param dataset: granule of pass
+        """
+
+        for variable, scenes in self._scenes.items():
+            dataset_data = dataset.data(variable, correct_sses=False)
+            dataset_valid = ~numpy.isnan(dataset_data)
+
+            if pass_time not in scenes:
+                scenes[pass_time] = (
+                    numpy.zeros(dataset_data.shape, dtype=self.dtype),
+                    numpy.zeros(dataset_data.shape, dtype=numpy.int8),
+                )
+
+            scene_sum, scene_count = scenes[pass_time]
+            scene_sum[dataset_valid] += dataset_data[dataset_valid]
+            scene_count += dataset_valid
+
+        dataset.release_arrays()
+
     def cell_size(self) -> tuple:
         """
         Get cell sizes of observation.
@@ -601,6 +791,35 @@ class VIIRSRange:
         :return dictionary of data per variable
         """
 
+        return {
+            variable: composite['value']
+            for variable, composite in self.composite(
+                start_time, end_time, average, correct_sses, variables, satellite
+            ).items()
+        }
+
+    def composite(
+        self,
+        start_time: datetime = None,
+        end_time: datetime = None,
+        average: bool = False,
+        correct_sses: bool = False,
+        variables: Collection[str] = None,
+        satellite: str = None,
+    ) -> dict:
+        """
+        Composite VIIRS scenes (either overlapped or averaged) from the given time interval, along with quality bands.
+        Overlapping keeps the latest valid pixel; averaging takes the mean of all valid pixels.
+
+        :param start_time: beginning of time interval (in UTC)
+        :param end_time: end of time interval (in UTC)
+        :param average: whether to average rasters, otherwise overlap them
+        :param correct_sses: whether to subtract SSES bias from L3 sea surface temperature data
+        :param variables: variables to composite (either 'sst' or 'sses')
+        :param satellite: VIIRS platform to retrieve. Default: per-granule averages of platform datasets
+        :return: dictionary per variable of composited `value`, `pass_time` of the latest valid scene and `count` of valid scenes per pixel
+        """
+
         start_time = start_time if start_time is not None else self.start_time
         end_time = end_time if end_time is not None else self.end_time
 
@@ -615,55 +834,67 @@ class VIIRSRange:
         if variables is None:
             variables = ['sst', 'sses']
 
-        variables_data = {}
+        grid_shape = (
+            VIIRSDataset.study_area_coordinates['lat'].shape[0],
+            VIIRSDataset.study_area_coordinates['lon'].shape[0],
+        )
+
+        composites = {}
 
         for variable in variables:
-            scenes_data = []
+            # stack scenes into a preallocated cube, skipping passes without data
+            scenes = numpy.empty((len(pass_times),) + grid_shape, dtype=self.dtype)
+            scene_times = numpy.empty(len(pass_times), dtype='datetime64[s]')
+            num_scenes = 0
 
             for pass_time in pass_times:
-                if len(self.datasets[pass_time]) > 0:
-                    if satellite is not None and satellite in self.datasets[pass_time]:
-                        dataset = self.datasets[pass_time][satellite]
-                        scene_data = dataset.data(variable, correct_sses)
-                    else:
-                        scene_data = numpy.nanmean(
-                            numpy.stack(
-                                [
-                                    dataset.data(variable, correct_sses)
-                                    for dataset in self.datasets[pass_time].values()
-                                ],
-                                axis=0,
-                            ),
-                            axis=0,
-                        )
+                if satellite is not None:
+                    datasets = [
+                        dataset
+                        for dataset_satellite, dataset in self.datasets[pass_time].items()
+                        if dataset_satellite == satellite
+                    ]
+                else:
+                    datasets = list(self.datasets[pass_time].values())
 
-                    if numpy.any(~numpy.isnan(scene_data)):
-                        scenes_data.append(scene_data)
+                if len(datasets) == 0:
+                    continue
 
-            variable_data = numpy.empty(
-                (
-                    VIIRSDataset.study_area_coordinates['lat'].shape[0],
-                    VIIRSDataset.study_area_coordinates['lon'].shape[0],
-                )
-            )
-            variable_data[:] = numpy.nan
+                scene = scenes[num_scenes]
+
+                if satellite is None and not correct_sses and variable in self._scenes:
+                    # platforms were already merged as granules arrived
+                    scene_sum, scene_count = self._scenes[variable][pass_time]
+                    scene[:] = numpy.nan
+                    numpy.divide(scene_sum, scene_count, out=scene, where=scene_count > 0)
+                elif len(datasets) == 1:
+                    scene[:] = datasets[0].data(variable, correct_sses)
+                else:
+                    # per-pixel mean of platform datasets
+                    scene_sum = numpy.zeros(grid_shape, dtype=self.dtype)
+                    scene_count = numpy.zeros(grid_shape, dtype=numpy.int8)
 
-            if len(scenes_data) > 0:
-                # check if user wants to average data
-                if average:
-                    variable_data = numpy.nanmean(numpy.stack(scenes_data, axis=0), axis=0)
-                else:  # otherwise overlap based on datetime
-                    for scene_data in scenes_data:
-                        if variable == 'sses':
-                            scene_data[scene_data == 0] = numpy.nan
+                    for dataset in datasets:
+                        dataset_data = dataset.data(variable, correct_sses)
+                        dataset_valid = ~numpy.isnan(dataset_data)
+                        scene_sum[dataset_valid] += dataset_data[dataset_valid]
+                        scene_count += dataset_valid
 
-                        variable_data[~numpy.isnan(scene_data)] = scene_data[
-                            ~numpy.isnan(scene_data)
-                        ]
+                    scene[:] = numpy.nan
+                    numpy.divide(scene_sum, scene_count, out=scene, where=scene_count > 0)
 
-            variables_data[variable] = variable_data
+                if not average and variable == 'sses':
+                    scene[scene == 0] = numpy.nan
 
-        return variables_data
+                if not numpy.isnan(scene).all():
+                    scene_times[num_scenes] = pass_time
+                    num_scenes += 1
+
+            composites[variable] = composite_scenes(
+                scenes[:num_scenes], scene_times[:num_scenes], average
+            )
+
+        return composites
 
     def write_rasters(
         self,
@@ -752,63 +983,16 @@ class VIIRSRange:
 
         for variable, output_data in variable_data.items():
             if output_data is not None and numpy.any(~numpy.isnan(output_data)):
-                output_data[numpy.isnan(output_data)] = fill_value
-
-                raster_data = output_data.astype(rasterio.float32)
-
-                if fill_value is not None:
-                    raster_data[numpy.isnan(raster_data)] = fill_value
-
-                # define arguments to GDAL driver
-                gdal_args = {
-                    'height': raster_data.shape[0],
-                    'width': raster_data.shape[1],
-                    'count': 1,
-                    'crs': OUTPUT_CRS,
-                    'dtype': raster_data.dtype,
-                    'nodata': numpy.array([fill_value]).astype(raster_data.dtype).item(),
-                    'transform': VIIRSRange.study_area_transform,
-                }
-
-                if driver == 'AAIGrid':
-                    file_extension = 'asc'
-                    gdal_args.update({'FORCE_CELLSIZE': 'YES'})
-                elif driver == 'GPKG':
-                    file_extension = 'gpkg'
-                else:
-                    file_extension = 'tiff'
-                    gdal_args.update(TIFF_CREATION_OPTIONS)
-
-                if filename_prefix is None:
-                    current_filename_prefix = f'viirs_{variable}'
-                else:
-                    current_filename_prefix = filename_prefix
-
-                if filename_suffix is None:
-                    start_time_string = f'{start_time:%Y%m%d%H%M}'
-                    end_time_string = f'{end_time:%Y%m%d%H%M}'
-
-                    if '0000' in start_time_string and '0000' in end_time_string:
-                        start_time_string = start_time_string.replace('0000', '')
-                        end_time_string = end_time_string.replace('0000', '')
-
-                    current_filename_suffix = f'{start_time_string}_{end_time_string}'
-                else:
-                    current_filename_suffix = filename_suffix
-
-                output_filename = (
+                write_composite_raster(
+                    output_data,
                     output_dir
-                    / f'{current_filename_prefix}_{current_filename_suffix}.{file_extension}'
+                    / composite_filename(
+                        variable, start_time, end_time, filename_prefix, filename_suffix
+                    ),
+                    VIIRSRange.study_area_transform,
+                    fill_value,
+                    driver,
                 )
-
-                LOGGER.info(f'Writing {output_filename}')
-                with rasterio.open(output_filename, 'w', driver, **gdal_args) as output_raster:
-                    output_raster.write(raster_data, 1)
-                    if driver == 'GTiff':
-                        output_raster.build_overviews(
-                            PyOFS.overview_levels(raster_data.shape), Resampling['average']
-                        )
-                        output_raster.update_tags(ns='rio_overview', resampling='average')
             else:
                 LOGGER.warning(
                     f'No {"VIIRS" if satellite is None else "VIIRS " + satellite} {variable} found between {start_time} and {end_time}.'
@@ -920,6 +1104,847 @@ class VIIRSRange:
         return f'{self.__class__.__name__}({", ".join(used_params)})'
 
 
+def default_version(data_time: datetime) -> str:
+    """
+    Get the ACSPO algorithm version in operation at the given time.
+
+    :param data_time: observation datetime
+    :return: ACSPO algorithm version
+    """
+
+    if data_time >= datetime(2019, 4, 23, 12, 50):
+        return '2.61'
+    elif data_time >= datetime(2018, 11, 7, 15, 10):
+        return '2.60'
+    elif data_time >= datetime(2017, 9, 14, 12, 50):
+        return '2.41'
+    else:
+        return '2.40'
+
+
+def granule_filename(data_time: datetime, satellite: str, algorithm: str, version: str) -> str:
+    """
+    Get the filename of the VIIRS L3U granule at the given time.
+
+    :param data_time: observation datetime (rounded to 10 minutes)
+    :param satellite: VIIRS platform
+    :param algorithm: either 'STAR' or 'OSPO'
+    :param version: ACSPO algorithm version
+    :return: granule filename
+    """
+
+    return f'{data_time:%Y%m%d%H%M%S}-{algorithm}-L3U_GHRSST-SSTsubskin-VIIRS_{satellite.upper()}-ACSPO_V{version}-v02.0-fv01.0.nc'
+
+
+def opendap_urls(
+    data_time: datetime,
+    satellite: str,
+    algorithm: str,
+    version: str,
+    near_real_time: bool,
+) -> OrderedDict:
+    """
+    Get OpenDAP URLs of the VIIRS L3U granule at the given time, in order of preference.
+
+    :param data_time: observation datetime (rounded to 10 minutes)
+    :param satellite: VIIRS platform
+    :param algorithm: either 'STAR' or 'OSPO'
+    :param version: ACSPO algorithm version
+    :param near_real_time: whether to use the near real time archive
+    :return: dictionary of URLs per source
+    """
+
+    day_dir = f'{data_time.year}/{data_time.timetuple().tm_yday:03}'
+    filename = granule_filename(data_time, satellite, algorithm, version)
+
+    urls = OrderedDict()
+
+    for source, source_url in SOURCE_URLS['OpenDAP'].items():
+        if near_real_time:
+            if source == 'NESDIS':
+                urls[source] = f'{source_url}/grid{satellite.upper()}VIIRSNRTL3UWW00/{day_dir}/{filename}'
+            elif source == 'JPL':
+                urls[source] = f'{source_url}/VIIRS_{satellite.upper()}/{algorithm}/v{version}/{day_dir}/{filename}'
+            elif source == 'NODC':
+                urls[source] = f'{source_url}/VIIRS_{satellite.upper()}/{algorithm}/{day_dir}/{filename}'
+        else:
+            if source == 'NESDIS':
+                urls[source] = f'{source_url}/gridS{satellite.upper()}VIIRSSCIENCEL3UWW00/{day_dir}/{filename}'
+            else:
+                LOGGER.debug(f'{source} does not contain a reanalysis archive')
+
+    return urls
+
+
+def ftp_paths(
+    data_time: datetime,
+    satellite: str,
+    algorithm: str,
+    version: str,
+    near_real_time: bool,
+) -> OrderedDict:
+    """
+    Get FTP hosts and paths of the VIIRS L3U granule at the given time, in order of preference.
+
+    :param data_time: observation datetime (rounded to 10 minutes)
+    :param satellite: VIIRS platform
+    :param algorithm: either 'STAR' or 'OSPO'
+    :param version: ACSPO algorithm version
+    :param near_real_time: whether to use the near real time archive
+    :return: dictionary of (host, path) per source
+    """
+
+    day_dir = f'{data_time.year}/{data_time.timetuple().tm_yday:03}'
+    filename = granule_filename(data_time, satellite, algorithm, version)
+
+    paths = OrderedDict()
+
+    for source, source_url in SOURCE_URLS['FTP'].items():
+        host_url, ftp_input_dir = source_url.split('/', 1)
+
+        if source == 'NESDIS':
+            if near_real_time:
+                ftp_path = f'/{ftp_input_dir}/nrt/viirs/{satellite.lower()}/l3u/{day_dir}/{filename}'
+            else:
+                ftp_path = f'/{ftp_input_dir}/ran/viirs/{"S" if satellite.upper() == "NPP" else ""}{satellite.lower()}/l3u/{day_dir}/{filename}'
+        else:
+            ftp_path = ftp_input_dir
+
+        paths[source] = (host_url, ftp_path)
+
+    return paths
+
+
+def granule_extent(attributes: dict) -> shapely.geometry.base.BaseGeometry:
+    """
+    Construct polygon of granule extent from the global attributes of a VIIRS granule.
+
+    :param attributes: granule attributes
+    :return: polygon of granule extent, or None if the granule has no stored bounds
+    """
+
+    if 'geospatial_bounds' in attributes:
+        return shapely.wkt.loads(attributes['geospatial_bounds'])
+    elif 'geospatial_lon_min' in attributes:
+        lon_min = float(attributes['geospatial_lon_min'])
+        lon_max = float(attributes['geospatial_lon_max'])
+        lat_min = float(attributes['geospatial_lat_min'])
+        lat_max = float(attributes['geospatial_lat_max'])
+
+        if lon_min < lon_max:
+            return shapely.geometry.Polygon(
+                [(lon_min, lat_max), (lon_max, lat_max), (lon_max, lat_min), (lon_min, lat_min)]
+            )
+        else:
+            # geospatial bounds cross the antimeridian, so we create a multipolygon
+            return shapely.geometry.MultiPolygon(
+                [
+                    shapely.geometry.Polygon(
+                        [(lon_min, lat_max), (180, lat_max), (180, lat_min), (lon_min, lat_min)]
+                    ),
+                    shapely.geometry.Polygon(
+                        [(-180, lat_max), (lon_max, lat_max), (lon_max, lat_min), (-180, lat_min)]
+                    ),
+                ]
+            )
+    else:
+        return None
+
+
+@contextmanager
+def host_request_slot(url: str):
+    """
+    Wait for one of the request slots of the host of the given URL, limiting concurrent requests to `MAX_REQUESTS_PER_HOST`.
+
+    :param url: URL of remote resource
+    """
+
+    host = urlparse(url).netloc or url.split('/')[0]
+
+    with _HOST_SEMAPHORES_LOCK:
+        if host not in _HOST_SEMAPHORES:
+            _HOST_SEMAPHORES[host] = threading.BoundedSemaphore(MAX_REQUESTS_PER_HOST)
+        host_semaphore = _HOST_SEMAPHORES[host]
+
+    with host_semaphore:
+        yield
+
+
+def fetch_granules(
+    granules: [(datetime, str)],
+    max_concurrency: int = MAX_CONCURRENT_GRANULES,
+    retries: int = GRANULE_FETCH_RETRIES,
+    backoff: timedelta = GRANULE_FETCH_BACKOFF,
+    **kwargs,
+) -> Iterator[tuple]:
+    """
+    Fetch VIIRS granules from a single queue on a background event loop, yielding each granule as soon as it arrives.
+    Granules that fail with anything other than `NoDataError` are retried with jittered exponential backoff.
+
+    :param granules: list of (pass time, satellite) to fetch
+    :param max_concurrency: maximum number of granules in flight
+    :param retries: number of times to retry a failed granule
+    :param backoff: base delay before the first retry
+    :param kwargs: keyword arguments to `VIIRSDataset`
+    :return: iterator of (pass time, satellite, dataset or exception) in order of arrival
+    """
+
+    results = queue.Queue()
+    stop = threading.Event()
+    errors = []
+
+    def run():
+        try:
+            asyncio.run(
+                _fetch_granules(
+                    granules, results, stop, max_concurrency, retries, backoff, **kwargs
+                )
+            )
+        except Exception as error:
+            errors.append(error)
+        finally:
+            results.put(None)
+
+    fetch_thread = threading.Thread(target=run, daemon=True)
+    fetch_thread.start()
+
+    try:
+        while True:
+            result = results.get()
+            if result is None:
+                break
+            yield result
+    finally:
+        # let in-flight granules finish, but do not start new ones if the consumer stopped early
+        stop.set()
+        fetch_thread.join()
+
+    if len(errors) > 0:
+        raise errors[0]
+
+
+async def _fetch_granules(
+    granules: [(datetime, str)],
+    results: queue.Queue,
+    stop: threading.Event,
+    max_concurrency: int,
+    retries: int,
+    backoff: timedelta,
+    **kwargs,
+):
+    pending = asyncio.Queue()
+    for granule in granules:
+        pending.put_nowait(granule)
+
+    loop = asyncio.get_running_loop()
+
+    with futures.ThreadPoolExecutor(max_concurrency) as concurrency_pool:
+
+        async def worker():
+            while not stop.is_set():
+                try:
+                    pass_time, satellite = pending.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+
+                try:
+                    result = await _fetch_granule(
+                        loop,
+                        concurrency_pool,
+                        pass_time,
+                        satellite,
+                        retries,
+                        backoff,
+                        **kwargs,
+                    )
+                except Exception as error:
+                    result = error
+
+                results.put((pass_time, satellite, result))
+
+        await asyncio.gather(*(worker() for _ in range(min(max_concurrency, len(granules)))))
+
+
+async def _fetch_granule(
+    loop: asyncio.AbstractEventLoop,
+    executor: futures.Executor,
+    pass_time: datetime,
+    satellite: str,
+    retries: int,
+    backoff: timedelta,
+    **kwargs,
+) -> 'VIIRSDataset':
+    for attempt in range(retries + 1):
+        try:
+            return await loop.run_in_executor(
+                executor,
+                functools.partial(VIIRSDataset, data_time=pass_time, satellite=satellite, **kwargs),
+            )
+        except PyOFS.NoDataError:
+            raise
+        except Exception as error:
+            if attempt >= retries:
+                raise
+
+            # full jitter keeps retries of simultaneous failures from arriving together
+            delay = random.uniform(0, backoff.total_seconds() * 2 ** attempt)
+            LOGGER.debug(
+                f'retrying {satellite} granule at {pass_time} UTC in {delay:.1f}s after {error.__class__.__name__}: {error}'
+            )
+            await asyncio.sleep(delay)
+
+
+def composite_filename(
+    variable: str,
+    start_time: datetime,
+    end_time: datetime,
+    filename_prefix: str = None,
+    filename_suffix: str = None,
+) -> str:
+    """
+    Get filename (without extension) of a VIIRS composite raster over the given time interval.
+
+    :param variable: variable name
+    :param start_time: beginning of time interval (in UTC)
+    :param end_time: end of time interval (in UTC)
+    :param filename_prefix: prefix for filename
+    :param filename_suffix: suffix for filename
+    :return: filename without extension
+    """
+
+    if filename_prefix is None:
+        filename_prefix = f'viirs_{variable}'
+
+    if filename_suffix is None:
+        start_time_string = f'{start_time:%Y%m%d%H%M}'
+        end_time_string = f'{end_time:%Y%m%d%H%M}'
+
+        if '0000' in start_time_string and '0000' in end_time_string:
+            start_time_string = start_time_string.replace('0000', '')
+            end_time_string = end_time_string.replace('0000', '')
+
+        filename_suffix = f'{start_time_string}_{end_time_string}'
+
+    return f'{filename_prefix}_{filename_suffix}'
+
+
+def write_composite_raster(
+    output_data: numpy.array,
+    output_filename: PathLike,
+    transform: rasterio.Affine,
+    fill_value: float = LEAFLET_NODATA_VALUE,
+    driver: str = 'GTiff',
+):
+    """
+    Write composited VIIRS data to a raster file.
+
+    :param output_data: array of composited data
+    :param output_filename: path to output file, without extension
+    :param transform: affine transformation mapping the pixel space to geographic space
+    :param fill_value: desired fill value of output
+    :param driver: string of valid GDAL driver (currently one of 'GTiff', 'GPKG', or 'AAIGrid')
+    """
+
+    if not isinstance(output_filename, Path):
+        output_filename = Path(output_filename)
+
+    raster_data = output_data.astype(rasterio.float32)
+
+    if fill_value is not None:
+        raster_data[numpy.isnan(raster_data)] = fill_value
+
+    # define arguments to GDAL driver
+    gdal_args = {
+        'height': raster_data.shape[0],
+        'width': raster_data.shape[1],
+        'count': 1,
+        'crs': OUTPUT_CRS,
+        'dtype': raster_data.dtype,
+        'nodata': numpy.array([fill_value]).astype(raster_data.dtype).item(),
+        'transform': transform,
+    }
+
+    if driver == 'AAIGrid':
+        file_extension = 'asc'
+        gdal_args.update({'FORCE_CELLSIZE': 'YES'})
+    elif driver == 'GPKG':
+        file_extension = 'gpkg'
+    else:
+        file_extension = 'tiff'
+        gdal_args.update(TIFF_CREATION_OPTIONS)
+
+    output_filename = output_filename.parent / f'{output_filename.name}.{file_extension}'
+
+    LOGGER.info(f'Writing {output_filename}')
+    with rasterio.open(output_filename, 'w', driver, **gdal_args) as output_raster:
+        output_raster.write(raster_data, 1)
+        if driver == 'GTiff':
+            output_raster.build_overviews(
+                PyOFS.overview_levels(raster_data.shape), Resampling['average']
+            )
+            output_raster.update_tags(ns='rio_overview', resampling='average')
+
+
+def update_composite(
+    output_dir: PathLike,
+    start_time: datetime,
+    end_time: datetime,
+    filename_prefix: str = None,
+    filename_suffix: str = None,
+    variable: str = 'sst',
+    satellites: list = ('NPP', 'N20'),
+    correct_sses: bool = False,
+    fill_value: float = LEAFLET_NODATA_VALUE,
+    driver: str = 'GTiff',
+    study_area_polygon_filename: PathLike = STUDY_AREA_POLYGON_FILENAME,
+    pass_times_filename: PathLike = PASS_TIMES_FILENAME,
+    algorithm: str = 'OSPO',
+    version: str = None,
+    state_dir: PathLike = COMPOSITE_STATE_DIRECTORY,
+    dtype: numpy.dtype = OBSERVATION_DTYPE,
+) -> xarray.Dataset:
+    """
+    Update an overlapped VIIRS composite over the given time interval with passes newer than those already composited, then rewrite its raster.
+    The composite state (latest valid value, its pass time and the count of valid scenes per pixel) persists between calls in the given state directory.
+    New granules are merged into the state as they arrive from the fetch queue.
+
+    :param output_dir: path to output directory
+    :param start_time: beginning of time interval (in UTC)
+    :param end_time: end of time interval (in UTC)
+    :param filename_prefix: prefix for output filename
+    :param filename_suffix: suffix for output filename
+    :param variable: variable to composite (either 'sst' or 'sses')
+    :param satellites: VIIRS platforms
+    :param correct_sses: whether to subtract SSES bias from L3 sea surface temperature data
+    :param fill_value: desired fill value of output
+    :param driver: string of valid GDAL driver (currently one of 'GTiff', 'GPKG', or 'AAIGrid')
+    :param study_area_polygon_filename: filename of vector file of study area boundary
+    :param pass_times_filename: path to text file with pass times
+    :param algorithm: either 'STAR' or 'OSPO'
+    :param version: ACSPO algorithm version
+    :param state_dir: path to directory of composite states
+    :param dtype: floating point type of composited data
+    :return: composite state
+    :raises NoDataError: if no data has been composited
+    """
+
+    if not isinstance(output_dir, Path):
+        output_dir = Path(output_dir)
+
+    if not isinstance(state_dir, Path):
+        state_dir = Path(state_dir)
+
+    filename = composite_filename(variable, start_time, end_time, filename_prefix, filename_suffix)
+    state_filename = state_dir / f'{filename}.nc'
+
+    if state_filename.exists():
+        with xarray.open_dataset(state_filename) as state_dataset:
+            state = state_dataset.load()
+        last_pass_time = datetime.strptime(state.attrs['last_pass_time'], '%Y-%m-%dT%H:%M:%S')
+        done_granules = set(state.attrs.get('done_granules', '').split())
+    else:
+        state = None
+        last_pass_time = None
+        done_granules = set()
+
+    # every granule up to the last complete pass is done; after it, granules that are done are listed individually
+    available_end_time = min(end_time, datetime.utcnow() - NRT_DELAY)
+    pass_times = [
+        pass_time
+        for pass_time in get_pass_times(start_time, available_end_time, pass_times_filename)
+        if start_time <= pass_time < available_end_time
+        and (last_pass_time is None or pass_time > last_pass_time)
+    ]
+    granules = [
+        (pass_time, satellite)
+        for pass_time in pass_times
+        for satellite in satellites
+        if granule_key(pass_time, satellite) not in done_granules
+    ]
+
+    # granules still missing from the source this long after observation are no longer requested
+    final_time = datetime.utcnow() - COMPOSITE_FINAL_DELAY
+    updated = False
+
+    if len(granules) > 0:
+        LOGGER.info(
+            f'Compositing {len(granules)} new or retried VIIRS granules between {granules[0][0]} UTC and {granules[-1][0]} UTC...'
+        )
+
+        if state is not None and 'value' in state:
+            values = state['value'].values.astype(dtype)
+            value_times = state['pass_time'].values.astype('datetime64[s]')
+            counts = state['count'].values.astype(numpy.int16)
+            if 'platforms' in state:
+                platform_counts = state['platforms'].values.astype(numpy.int8)
+            else:
+                platform_counts = (~numpy.isnan(values)).astype(numpy.int8)
+
+            # pixels observed by passes that are not complete yet, so that each pass is counted once per pixel
+            if 'incomplete_pass' in state:
+                pass_valid = {
+                    pass_time.astype('datetime64[s]').astype(datetime): pass_mask.astype(bool)
+                    for pass_time, pass_mask in zip(
+                        state['incomplete_pass'].values, state['incomplete_valid'].values
+                    )
+                }
+            else:
+                pass_valid = {}
+        else:
+            values = None
+            pass_valid = {}
+
+        # merge granules as they arrive; the latest pass wins and platforms of the same pass are averaged
+        for pass_time, satellite, result in fetch_granules(
+            granules,
+            study_area_polygon_filename=study_area_polygon_filename,
+            algorithm=algorithm,
+            version=version,
+            dtype=dtype,
+        ):
+            if isinstance(result, Exception):
+                LOGGER.warning(f'Dataset creation error: {result}')
+
+                # granules without a pass over the study area are done; missing granules are retried until final
+                if isinstance(result, NoPassError) or (
+                    isinstance(result, PyOFS.NoDataError) and pass_time < final_time
+                ):
+                    done_granules.add(granule_key(pass_time, satellite))
+                    updated = True
+                continue
+
+            granule_data = result.data(variable, correct_sses)
+            if variable == 'sses':
+                granule_data = numpy.where(granule_data == 0, numpy.nan, granule_data)
+
+            if values is None:
+                values = numpy.full(granule_data.shape, numpy.nan, dtype=dtype)
+                value_times = numpy.full(
+                    granule_data.shape, numpy.datetime64('NaT'), dtype='datetime64[s]'
+                )
+                counts = numpy.zeros(granule_data.shape, dtype=numpy.int16)
+                platform_counts = numpy.zeros(granule_data.shape, dtype=numpy.int8)
+
+            if values.shape != granule_data.shape:
+                # the grid cannot change between updates, so retrying the granule would never succeed
+                LOGGER.warning(f'{result} does not match the grid of {state_filename}; skipping')
+                done_granules.add(granule_key(pass_time, satellite))
+                updated = True
+                continue
+
+            granule_time = numpy.datetime64(pass_time, 's')
+
+            valid = ~numpy.isnan(granule_data)
+            # NaT compares false, so pixels without data are always superseded
+            newer = valid & ~(value_times >= granule_time)
+            same = valid & (value_times == granule_time)
+
+            # running mean over the platforms of the latest pass of each pixel
+            values[newer] = granule_data[newer]
+            platform_counts[newer] = 1
+            values[same] = (values[same] * platform_counts[same] + granule_data[same]) / (
+                platform_counts[same] + 1
+            )
+            platform_counts[same] += 1
+            value_times[newer] = granule_time
+
+            # count each pass once per pixel, regardless of how many platforms observed it
+            if pass_time not in pass_valid:
+                pass_valid[pass_time] = numpy.zeros(values.shape, dtype=bool)
+            counts += valid & ~pass_valid[pass_time]
+            pass_valid[pass_time] |= valid
+
+            done_granules.add(granule_key(pass_time, satellite))
+            updated = True
+
+        if updated:
+            # advance past passes of which every granule is done
+            for pass_time in pass_times:
+                if any(
+                    granule_key(pass_time, satellite) not in done_granules
+                    for satellite in satellites
+                ):
+                    break
+                last_pass_time = pass_time
+                done_granules -= {granule_key(pass_time, satellite) for satellite in satellites}
+                pass_valid.pop(pass_time, None)
+
+        if updated and values is not None:
+            if state is None or 'value' not in state:
+                state = xarray.Dataset(
+                    coords={
+                        'lat': VIIRSDataset.study_area_coordinates['lat'].values,
+                        'lon': VIIRSDataset.study_area_coordinates['lon'].values,
+                    },
+                    attrs={'transform': list(VIIRSDataset.study_area_transform)[:6]},
+                )
+            else:
+                state = state.drop_vars(['incomplete_pass', 'incomplete_valid'], errors='ignore')
+
+            incomplete_passes = sorted(pass_valid)
+
+            state['value'] = (('lat', 'lon'), values)
+            state['pass_time'] = (('lat', 'lon'), value_times)
+            state['count'] = (('lat', 'lon'), counts)
+            state['platforms'] = (('lat', 'lon'), platform_counts)
+            state['incomplete_pass'] = (
+                'incomplete_pass',
+                numpy.array(incomplete_passes, dtype='datetime64[s]'),
+            )
+            state['incomplete_valid'] = (
+                ('incomplete_pass', 'lat', 'lon'),
+                numpy.array(
+                    [pass_valid[pass_time] for pass_time in incomplete_passes], dtype=numpy.int8
+                ).reshape((len(incomplete_passes),) + values.shape),
+            )
+        elif updated:
+            # no granule had data yet, but the granules that are done must not be requested again
+            state = xarray.Dataset()
+
+        if updated:
+            # passes are only composited once every granule up to them is done
+            if last_pass_time is None:
+                last_pass_time = start_time - timedelta(seconds=1)
+            state.attrs['last_pass_time'] = f'{last_pass_time:%Y-%m-%dT%H:%M:%S}'
+            state.attrs['done_granules'] = ' '.join(sorted(done_granules))
+
+            encoding = {
+                'pass_time': {'units': 'seconds since 1970-01-01 00:00:00'},
+                'incomplete_pass': {'units': 'seconds since 1970-01-01 00:00:00'},
+                'incomplete_valid': {'zlib': True},
+            }
+            utilities.write_atomically(
+                state_filename,
+                functools.partial(
+                    state.to_netcdf,
+                    encoding={name: value for name, value in encoding.items() if name in state},
+                ),
+            )
+    elif state is not None:
+        LOGGER.debug(f'No new VIIRS passes since {last_pass_time} UTC')
+
+    if state is None or 'value' not in state:
+        raise PyOFS.NoDataError(
+            f'No VIIRS {variable} found between {start_time} UTC and {end_time} UTC.'
+        )
+
+    output_filename = output_dir / filename
+    if updated or not any(output_dir.glob(f'{filename}.*')):
+        write_composite_raster(
+            state['value'].values,
+            output_filename,
+            rasterio.Affine(*state.attrs['transform']),
+            fill_value,
+            driver,
+        )
+
+    return state
+
+
+def granule_key(pass_time: datetime, satellite: str) -> str:
+    """
+    Get key of a granule, as stored in the state of incremental composites.
+
+    :param pass_time: pass time
+    :param satellite: VIIRS platform
+    :return: key of granule
+    """
+
+    return f'{pass_time:%Y%m%dT%H%M%S}_{satellite.upper()}'
+
+
+def composite_scenes(
+    scenes: numpy.array, scene_times: numpy.array = None, average: bool = False
+) -> dict:
+    """
+    Composite a time-ordered stack of scenes, either keeping the latest valid pixel or averaging all valid pixels.
+
+    :param scenes: array of scenes of shape (scene, lat, lon), where invalid pixels are NaN
+    :param scene_times: times of scenes
+    :param average: whether to average scenes, otherwise overlap them
+    :return: dictionary of composited `value`, `pass_time` of the latest valid scene and `count` of valid scenes per pixel
+    """
+
+    valid = ~numpy.isnan(scenes)
+    counts = numpy.count_nonzero(valid, axis=0)
+    no_data = counts == 0
+
+    if len(scenes) > 0:
+        # index of the last valid scene per pixel, from the first valid index of the reversed mask
+        latest_indices = len(scenes) - 1 - numpy.argmax(valid[::-1], axis=0)
+    else:
+        latest_indices = numpy.zeros(scenes.shape[1:], dtype=int)
+
+    if average:
+        values = numpy.full(scenes.shape[1:], numpy.nan, dtype=scenes.dtype)
+        numpy.divide(
+            numpy.where(valid, scenes, 0).sum(axis=0, dtype=numpy.float64),
+            counts,
+            out=values,
+            where=~no_data,
+        )
+    elif len(scenes) > 0:
+        values = numpy.take_along_axis(scenes, latest_indices[None, :, :], axis=0)[0]
+    else:
+        values = numpy.full(scenes.shape[1:], numpy.nan, dtype=scenes.dtype)
+
+    if scene_times is not None and len(scene_times) > 0:
+        pass_times = numpy.asarray(scene_times, dtype='datetime64[s]')[latest_indices]
+        pass_times[no_data] = numpy.datetime64('NaT')
+    else:
+        pass_times = numpy.full(scenes.shape[1:], numpy.datetime64('NaT'), dtype='datetime64[s]')
+
+    return {'value': values, 'pass_time': pass_times, 'count': counts}
+
+
+def granule_cache_filename(
+    data_time: datetime,
+    satellite: str,
+    algorithm: str,
+    version: str,
+    study_area_polygon_filename: PathLike = STUDY_AREA_POLYGON_FILENAME,
+) -> Path:
+    """
+    Get path of the cached study area subset of the VIIRS granule at the given time.
+
+    :param data_time: observation datetime (rounded to 10 minutes)
+    :param satellite: VIIRS platform
+    :param algorithm: either 'STAR' or 'OSPO'
+    :param version: ACSPO algorithm version
+    :param study_area_polygon_filename: filename of vector file containing study area boundary
+    :return: path to cached granule
+    """
+
+    return (
+        utilities.study_area_cache_directory(GRANULE_CACHE_DIRECTORY, study_area_polygon_filename)
+        / f'viirs_{data_time:%Y%m%dT%H%M%S}_{satellite.upper()}_{algorithm}_{version}.nc'
+    )
+
+
+def write_cached_granule(dataset: xarray.Dataset, cache_filename: PathLike):
+    """
+    Write study area subset of a VIIRS granule to the local granule cache, then evict least recently used granules beyond the cache size limit.
+
+    :param dataset: cropped granule
+    :param cache_filename: path to cached granule
+    """
+
+    # keep the packed integer encoding of the source granule and compress it
+    encoding = {}
+    for variable_name, variable in dataset.data_vars.items():
+        encoding[variable_name] = {
+            key: value
+            for key, value in variable.encoding.items()
+            if key in ('dtype', 'scale_factor', 'add_offset', '_FillValue')
+        }
+        encoding[variable_name].update({'zlib': True, 'complevel': 4})
+
+    try:
+        utilities.write_atomically(
+            cache_filename, functools.partial(dataset.to_netcdf, encoding=encoding)
+        )
+    except Exception as error:
+        LOGGER.warning(f'could not cache granule: {error.__class__.__name__}: {error}')
+        return
+
+    prune_granule_cache()
+
+
+def prune_granule_cache(
+    cache_directory: PathLike = GRANULE_CACHE_DIRECTORY,
+    size_limit: int = GRANULE_CACHE_SIZE_LIMIT,
+):
+    """
+    Delete least recently used granules from the given cache directory (including subsets of earlier study areas) until it fits within the given size.
+
+    :param cache_directory: path to directory of cached granules
+    :param size_limit: maximum total size of cached granules in bytes
+    """
+
+    if not isinstance(cache_directory, Path):
+        cache_directory = Path(cache_directory)
+
+    with _GRANULE_CACHE_LOCK:
+        cached_granules = []
+        for filename in cache_directory.rglob('*.nc'):
+            try:
+                file_status = filename.stat()
+            except FileNotFoundError:
+                continue
+            cached_granules.append((file_status.st_mtime, file_status.st_size, filename))
+
+        total_size = sum(file_size for _, file_size, _ in cached_granules)
+
+        for _, file_size, filename in sorted(cached_granules):
+            if total_size <= size_limit:
+                break
+
+            try:
+                os.remove(filename)
+                total_size -= file_size
+            except OSError as error:
+                LOGGER.debug(f'{error.__class__.__name__}: {error}')
+
+
+def overlaps_area(
+    data_extent: shapely.geometry.base.BaseGeometry, area: shapely.geometry.base.BaseGeometry
+) -> bool:
+    """
+    Check whether the given granule extent shares any interior with the given area; extents that only touch its boundary do not count.
+
+    :param data_extent: polygon of granule extent
+    :param area: polygon of area (preferably prepared with `shapely.prepare`)
+    :return: whether granule extent overlaps area
+    """
+
+    return bool(shapely.intersects(area, data_extent)) and not shapely.touches(
+        area, data_extent
+    )
+
+
+def read_granule_extent(
+    data_time: datetime, satellite: str = 'NPP', algorithm: str = 'OSPO', version: str = None
+) -> shapely.geometry.base.BaseGeometry:
+    """
+    Read the extent of the VIIRS granule at the given time from its OpenDAP attributes, without accessing any data variables.
+
+    :param data_time: observation datetime
+    :param satellite: VIIRS platform
+    :param algorithm: either 'STAR' or 'OSPO'
+    :param version: ACSPO algorithm version
+    :return: polygon of granule extent, or None if the granule has no stored bounds
+    :raises NoDataError: if every source confirms that the granule does not exist
+    :raises ConnectionError: if the granule was not found and a source could not be reached
+    """
+
+    data_time = PyOFS.round_to_ten_minutes(data_time)
+    near_real_time = datetime.now() - data_time <= timedelta(days=13)
+
+    if version is None:
+        version = default_version(data_time)
+
+    connection_error = None
+
+    for source, url in opendap_urls(
+        data_time, satellite, algorithm, version, near_real_time
+    ).items():
+        try:
+            with host_request_slot(url), netCDF4.Dataset(url) as granule:
+                return granule_extent(granule.__dict__)
+        except OSError as error:
+            LOGGER.debug(f'{error.__class__.__name__}: {error}')
+
+            if error.errno not in GRANULE_NOT_FOUND_ERRORS:
+                connection_error = error
+
+    if connection_error is not None:
+        raise ConnectionError(
+            f'Could not read VIIRS granule at {data_time} UTC: {connection_error}'
+        ) from connection_error
+
+    raise PyOFS.NoDataError(f'No VIIRS granule found at {data_time} UTC.')
+
+
 def store_viirs_pass_times(
     satellite: str,
     study_area_polygon_filename: PathLike = STUDY_AREA_POLYGON_FILENAME,
@@ -928,9 +1953,11 @@ def store_viirs_pass_times(
     num_periods: int = 1,
     algorithm: str = 'STAR',
     version: str = '2.40',
+    max_workers: int = None,
 ):
     """
     Compute VIIRS pass times from the given start date along the number of periods specified.
+    Progress is checkpointed next to the output file, so an interrupted run with the same parameters resumes where it left off.
 
     :param satellite: satellite for which to store pass times, either NPP or N20
     :param study_area_polygon_filename: path to vector file containing polygon of study area
@@ -939,11 +1966,15 @@ def store_viirs_pass_times(
     :param num_periods: number of periods to store
     :param algorithm: either 'STAR' or 'OSPO'
     :param version: ACSPO Version number (2.40 - 2.41)
+    :param max_workers: maximum number of granules to probe concurrently
     """
 
     if not isinstance(study_area_polygon_filename, Path):
         study_area_polygon_filename = Path(study_area_polygon_filename)
 
+    if not isinstance(output_filename, Path):
+        output_filename = Path(output_filename)
+
     start_time = PyOFS.round_to_ten_minutes(start_time)
     end_time = PyOFS.round_to_ten_minutes(start_time + (VIIRS_PERIOD * num_periods))
 
@@ -953,58 +1984,153 @@ def store_viirs_pass_times(
 
     datetime_range = PyOFS.ten_minute_range(start_time, end_time)
 
-    # construct polygon from the first record in layer
-    study_area_polygon = shapely.geometry.Polygon(
-        utilities.get_first_record(study_area_polygon_filename)['geometry']['coordinates'][0]
+    # prepared polygon of the first record in layer
+    study_area = utilities.get_first_geometry(study_area_polygon_filename)
+    study_area_polygon = study_area.geometry
+
+    # find number of cycles from the first orbit to the present day
+    num_cycles = int((datetime.now() - start_time).days / 16)
+
+    # read slots that were already probed in a previous run, as lines of `slot,pass time,duration` after a header of the parameters
+    checkpoint_filename = output_filename.parent / f'{output_filename.name}.checkpoint'
+    checkpoint_header = (
+        f'# satellite={satellite.upper()} algorithm={algorithm} version={version} '
+        f'start={start_time:%Y%m%dT%H%M%S} end={end_time:%Y%m%dT%H%M%S} '
+        f'study_area={hashlib.sha1(study_area.wkb).hexdigest()[:8]}'
     )
+    probed_slots = {}
 
-    lines = []
+    if checkpoint_filename.exists():
+        with open(checkpoint_filename) as checkpoint_file:
+            previous_header = checkpoint_file.readline().strip()
 
-    for datetime_index in range(len(datetime_range)):
-        current_time = datetime_range[datetime_index]
+            if previous_header == checkpoint_header:
+                for line in checkpoint_file:
+                    slot, pass_line = line.strip().split(',', 1)
+                    probed_slots[datetime.strptime(slot, '%Y%m%dT%H%M%S')] = pass_line
 
-        # find number of cycles from the first orbit to the present day
-        num_cycles = int((datetime.now() - start_time).days / 16)
+        if previous_header == checkpoint_header:
+            LOGGER.info(f'Resuming from {len(probed_slots)} slots in {checkpoint_filename}')
+        else:
+            LOGGER.warning(
+                f'discarding {checkpoint_filename}, which was written with other parameters ({previous_header})'
+            )
+            os.remove(checkpoint_filename)
+
+    if not checkpoint_filename.exists():
+        with open(checkpoint_filename, 'w') as checkpoint_file:
+            checkpoint_file.write(f'{checkpoint_header}\n')
+
+    with futures.ThreadPoolExecutor(max_workers) as concurrency_pool:
+        running_futures = {
+            concurrency_pool.submit(
+                _probe_pass_time,
+                current_time,
+                start_time,
+                num_cycles,
+                satellite,
+                study_area_polygon,
+                algorithm,
+                version,
+            ): current_time
+            for current_time in datetime_range
+            if current_time not in probed_slots
+        }
+
+        with open(checkpoint_filename, 'a') as checkpoint_file:
+            for completed_future in futures.as_completed(running_futures):
+                current_time = running_futures[completed_future]
 
-        # iterate over each cycle
-        for cycle_index in range(0, num_cycles):
-            # get current datetime of interest
-            cycle_offset = VIIRS_PERIOD * cycle_index
-            cycle_time = current_time + cycle_offset
+                try:
+                    pass_line = completed_future.result()
+                except Exception as error:
+                    # leave the slot out of the checkpoint so that it is probed again on the next run
+                    LOGGER.warning(f'{error.__class__.__name__}: {error}')
+                    continue
+
+                if pass_line is None:
+                    pass_line = ''
+
+                probed_slots[current_time] = pass_line
+                checkpoint_file.write(f'{current_time:%Y%m%dT%H%M%S},{pass_line}\n')
+                checkpoint_file.flush()
+
+        del running_futures
+
+    lines = [
+        probed_slots[current_time]
+        for current_time in sorted(probed_slots)
+        if probed_slots[current_time] != ''
+    ]
+
+    # write lines to file
+    with open(output_filename, 'w') as output_file:
+        output_file.write('\n'.join(lines))
+
+    # keep the checkpoint only while slots remain to be probed again
+    num_remaining = sum(1 for current_time in datetime_range if current_time not in probed_slots)
+    if num_remaining == 0:
+        os.remove(checkpoint_filename)
+    else:
+        LOGGER.warning(
+            f'{num_remaining} slots could not be probed; run again to resume from {checkpoint_filename}'
+        )
 
-            try:
-                # get observation of new datetime
-                dataset = VIIRSDataset(
-                    cycle_time, satellite, study_area_polygon_filename, algorithm, version
-                )
+    LOGGER.info('Wrote data to file')
 
-                # check if observation falls within polygon extent
-                if dataset.data_extent.is_valid:
-                    if study_area_polygon.intersects(dataset.data_extent):
-                        # get duration from current cycle start
-                        cycle_duration = cycle_time - (start_time + cycle_offset)
 
-                        LOGGER.info(
-                            f'{cycle_time:%Y%m%dT%H%M%S} {cycle_duration / timedelta(seconds=1)}: valid scene (checked {cycle_index + 1} cycle(s))'
-                        )
-                        lines.append(
-                            f'{cycle_time:%Y%m%dT%H%M%S},{cycle_duration / timedelta(seconds=1)}'
-                        )
+def _probe_pass_time(
+    current_time: datetime,
+    start_time: datetime,
+    num_cycles: int,
+    satellite: str,
+    study_area_polygon: shapely.geometry.base.BaseGeometry,
+    algorithm: str,
+    version: str,
+) -> str:
+    """
+    Check whether a VIIRS pass over the study area occurs at the given time, using the first cycle with an existing granule.
 
-                # if we get to here, break and continue to the next datetime
-                break
-            except PyOFS.NoDataError as error:
-                LOGGER.warning(f'{error.__class__.__name__}: {error}')
-        else:
-            LOGGER.warning(
-                f'{current_time:%Y%m%dT%H%M%S}: missing observation across all cycles'
-            )
+    :param current_time: time within the first VIIRS period
+    :param start_time: beginning of the first VIIRS period (in UTC)
+    :param num_cycles: number of cycles to check
+    :param satellite: VIIRS platform
+    :param study_area_polygon: polygon of study area
+    :param algorithm: either 'STAR' or 'OSPO'
+    :param version: ACSPO algorithm version
+    :return: line of pass time and duration from cycle start, or None if not a valid pass
+    :raises ConnectionError: if a granule could not be read, so that the slot is probed again later
+    """
 
-        # write lines to file
-        with open(output_filename, 'w') as output_file:
-            output_file.write('\n'.join(lines))
+    # iterate over each cycle
+    for cycle_index in range(0, num_cycles):
+        # get current datetime of interest
+        cycle_offset = VIIRS_PERIOD * cycle_index
+        cycle_time = current_time + cycle_offset
+
+        try:
+            # get extent of granule at new datetime
+            data_extent = read_granule_extent(cycle_time, satellite, algorithm, version)
+        except PyOFS.NoDataError as error:
+            LOGGER.warning(f'{error.__class__.__name__}: {error}')
+            continue
+
+        # check if observation falls within polygon extent
+        if data_extent is not None and data_extent.is_valid:
+            if overlaps_area(data_extent, study_area_polygon):
+                # get duration from current cycle start
+                cycle_duration = cycle_time - (start_time + cycle_offset)
+
+                LOGGER.info(
+                    f'{cycle_time:%Y%m%dT%H%M%S} {cycle_duration / timedelta(seconds=1)}: valid scene (checked {cycle_index + 1} cycle(s))'
+                )
+                return f'{cycle_time:%Y%m%dT%H%M%S},{cycle_duration / timedelta(seconds=1)}'
 
-        LOGGER.info('Wrote data to file')
+        # if we get to here, continue to the next datetime
+        return None
+    else:
+        LOGGER.warning(f'{current_time:%Y%m%dT%H%M%S}: missing observation across all cycles')
+        return None
 
 
 def get_pass_times(
@@ -1018,41 +2144,28 @@ def get_pass_times(
     :param start_time: beginning of time interval (in UTC)
     :param end_time: end of time interval (in UTC)
     :param pass_times_filename: filename of text file with durations of first VIIRS period
-    :return:
+    :return: array of pass datetimes
     """
 
     if not isinstance(pass_times_filename, Path):
         pass_times_filename = Path(pass_times_filename)
 
-    # get datetime of first pass in given file
-    first_pass_row = numpy.genfromtxt(pass_times_filename, dtype=str, delimiter=',')[0, :]
-    viirs_start_time = datetime.strptime(first_pass_row[0], '%Y%m%dT%H%M%S') - timedelta(
-        seconds=float(first_pass_row[1])
-    )
+    viirs_start_time, pass_durations = _read_pass_durations(pass_times_filename)
 
-    # get starting datetime of the current VIIRS period
-    period_start_time = viirs_start_time + timedelta(
-        days=numpy.floor((start_time - viirs_start_time).days / 16) * 16
-    )
+    start_time = numpy.datetime64(start_time, 's')
+    end_time = numpy.datetime64(end_time, 's')
+    period = numpy.timedelta64(VIIRS_PERIOD).astype('timedelta64[s]')
 
-    # get array of seconds since the start of the first 16-day VIIRS period
-    pass_durations = numpy.genfromtxt(pass_times_filename, dtype=str, delimiter=',')[
-                     :, 1
-                     ].T.astype(numpy.float32)
-    pass_durations = numpy.asarray(
-        [timedelta(seconds=float(duration)) for duration in pass_durations]
-    )
-
-    # add extra VIIRS periods to end of pass durations
-    if end_time > (period_start_time + VIIRS_PERIOD):
-        extra_periods = math.ceil((end_time - period_start_time) / VIIRS_PERIOD) - 1
-        for period in range(extra_periods):
-            pass_durations = numpy.append(
-                pass_durations, pass_durations[-360:] + pass_durations[-1]
-            )
+    # get starting datetime of the current VIIRS period
+    period_start_time = viirs_start_time + (start_time - viirs_start_time) // period * period
 
-    # get datetimes of VIIRS passes within the given time interval
-    pass_times = period_start_time + pass_durations
+    # tile pass durations over as many VIIRS periods as needed to reach the end of the interval
+    num_periods = max(int(numpy.ceil((end_time - period_start_time) / period)), 1)
+    pass_times = (
+        period_start_time
+        + (numpy.arange(num_periods) * period)[:, None]
+        + pass_durations[None, :]
+    ).ravel()
 
     # find starting and ending times within the given time interval
     start_index = numpy.searchsorted(pass_times, start_time)
@@ -1063,9 +2176,50 @@ def get_pass_times(
         end_index += 1
 
     # trim datetimes to within the given time interval
-    pass_times = pass_times[start_index:end_index]
+    return pass_times[start_index:end_index].astype(datetime)
+
+
+def _read_pass_durations(pass_times_filename: Path) -> (numpy.datetime64, numpy.array):
+    """
+    Read the start of the first VIIRS period and the pass durations from that start, caching by file modification time.
+
+    :param pass_times_filename: filename of text file with durations of first VIIRS period
+    :return: start of first VIIRS period and array of pass durations
+    """
+
+    pass_times_filename = pass_times_filename.resolve()
+    modification_time = pass_times_filename.stat().st_mtime
+
+    with _PASS_TIMES_LOCK:
+        if pass_times_filename in _PASS_TIMES_CACHE:
+            cached_modification_time, cached_pass_durations = _PASS_TIMES_CACHE[
+                pass_times_filename
+            ]
+            if cached_modification_time == modification_time:
+                return cached_pass_durations
+
+        pass_times_table = numpy.loadtxt(
+            pass_times_filename, dtype=str, delimiter=',', ndmin=2
+        )
+
+        pass_durations = numpy.round(pass_times_table[:, 1].astype(numpy.float64)).astype(
+            'timedelta64[s]'
+        )
+
+        # get datetime of the beginning of the first VIIRS period from the first pass in the file
+        viirs_start_time = (
+            numpy.datetime64(datetime.strptime(pass_times_table[0, 0], '%Y%m%dT%H%M%S'), 's')
+            - pass_durations[0]
+        )
+
+        pass_durations.flags.writeable = False
+
+        _PASS_TIMES_CACHE[pass_times_filename] = (
+            modification_time,
+            (viirs_start_time, pass_durations),
+        )
 
-    return pass_times
+    return viirs_start_time, pass_durations
 
 
 if __name__ == '__main__':
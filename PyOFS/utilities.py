@@ -1,7 +1,12 @@
 from datetime import datetime, timedelta
 from functools import partial
+import hashlib
+import os
 from os import PathLike
 from pathlib import Path
+import tempfile
+import threading
+from typing import Callable, NamedTuple, Tuple
 
 import fiona
 import fiona.crs
@@ -25,6 +30,10 @@ SIDEREAL_ROTATION_PERIOD = timedelta(hours=23, minutes=56, seconds=4.1)
 
 LOGGER = get_logger('PyOFS.utili')
 
+# first records of vector layers, keyed by (path, layer) and stored with the modification time they were read at
+_FIRST_RECORDS = {}
+_FIRST_RECORDS_LOCK = threading.Lock()
+
 
 def copy_xarray(input_path: str, output_path: str) -> xarray.Dataset:
     """
@@ -181,7 +190,24 @@ def datetime64_to_time(datetime64: numpy.datetime64) -> datetime:
     return datetime.fromtimestamp(datetime64.values.astype(datetime) * 1e-9)
 
 
-def get_first_record(vector_dataset_filename: PathLike):
+class LayerGeometry(NamedTuple):
+    """
+    Parsed geometry of a vector record, shared between callers and therefore immutable.
+    """
+
+    geometry: shapely.geometry.base.BaseGeometry
+    bounds: Tuple[float, float, float, float]
+    wkb: bytes
+
+
+def _read_first_record(vector_dataset_filename: PathLike) -> (dict, LayerGeometry):
+    """
+    Read first record of the given vector layer, reusing the previous read unless the file has been modified since.
+
+    :param vector_dataset_filename: path to vector file, with optional `:layer` suffix
+    :return: record and its parsed geometry
+    """
+
     if not isinstance(vector_dataset_filename, Path):
         vector_dataset_filename = Path(vector_dataset_filename)
 
@@ -191,8 +217,104 @@ def get_first_record(vector_dataset_filename: PathLike):
         vector_dataset_filename
     )
 
-    with fiona.open(vector_dataset_filename, **fiona_kwargs) as vector_layer:
-        return next(iter(vector_layer))
+    key = (str(vector_dataset_filename.resolve()), fiona_kwargs['layer'])
+    modified_time = os.stat(vector_dataset_filename).st_mtime_ns
+
+    with _FIRST_RECORDS_LOCK:
+        if key not in _FIRST_RECORDS or _FIRST_RECORDS[key][0] != modified_time:
+            LOGGER.debug(f'Reading first record of {vector_dataset_filename}')
+
+            with fiona.open(vector_dataset_filename, **fiona_kwargs) as vector_layer:
+                record = next(iter(vector_layer))
+
+            geometry = shape(record['geometry'])
+            shapely.prepare(geometry)
+
+            _FIRST_RECORDS[key] = (
+                modified_time,
+                record,
+                LayerGeometry(geometry, geometry.bounds, shapely.to_wkb(geometry)),
+            )
+
+        return _FIRST_RECORDS[key][1:]
+
+
+def get_first_record(vector_dataset_filename: PathLike):
+    """
+    Get first record of the given vector layer.
+    The vector file is read once per process (and again only if modified), so the returned record must not be modified.
+
+    :param vector_dataset_filename: path to vector file, with optional `:layer` suffix
+    :return: first record
+    """
+
+    return _read_first_record(vector_dataset_filename)[0]
+
+
+def get_first_geometry(vector_dataset_filename: PathLike) -> LayerGeometry:
+    """
+    Get prepared geometry, bounds, and WKB of the first record of the given vector layer.
+
+    :param vector_dataset_filename: path to vector file, with optional `:layer` suffix
+    :return: parsed geometry
+    """
+
+    return _read_first_record(vector_dataset_filename)[1]
+
+
+def write_atomically(filename: PathLike, write: Callable[[Path], None]):
+    """
+    Write a file through a uniquely named temporary file in the same directory, then move it into place.
+    Readers never see a partial file, and concurrent writers of the same file do not interfere; the last one to finish wins.
+
+    :param filename: path to output file
+    :param write: function that writes the output to the given path
+    """
+
+    if not isinstance(filename, Path):
+        filename = Path(filename)
+
+    if not filename.parent.exists():
+        os.makedirs(filename.parent, exist_ok=True)
+
+    file_descriptor, temporary_filename = tempfile.mkstemp(
+        suffix='.tmp', prefix=f'.{filename.name}.', dir=filename.parent
+    )
+    os.close(file_descriptor)
+
+    try:
+        write(Path(temporary_filename))
+        os.replace(temporary_filename, filename)
+    except BaseException:
+        if os.path.exists(temporary_filename):
+            os.remove(temporary_filename)
+        raise
+
+
+def study_area_cache_directory(
+    cache_directory: PathLike, study_area_polygon_filename: PathLike
+) -> Path:
+    """
+    Get directory of cached study area subsets within the given cache directory.
+    The directory is named after the study area and a digest of its geometry, so subsets are not reused once the study area changes.
+
+    :param cache_directory: path to cache directory
+    :param study_area_polygon_filename: path to vector file containing study area boundary, with optional `:layer` suffix
+    :return: path to directory
+    """
+
+    if not isinstance(cache_directory, Path):
+        cache_directory = Path(cache_directory)
+
+    study_area_filename, study_area_layer = split_layer_filename(study_area_polygon_filename)
+    study_area_name = study_area_filename.stem
+
+    if study_area_layer is not None:
+        study_area_name = f'{study_area_name}_{study_area_layer}'
+
+    geometry_digest = hashlib.sha1(get_first_geometry(study_area_polygon_filename).wkb).hexdigest()
+
+    return cache_directory / f'{study_area_name}_{geometry_digest[:8]}'
 
 
 class RotatedPoleCoordinateSystem:
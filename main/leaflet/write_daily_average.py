@@ -43,7 +43,10 @@ LOGGER = get_logger('PyOFS', LOG_FILENAME, file_level=logging.INFO, console_leve
 
 
 def write_observation(
-    output_dir: PathLike, observation_date: Union[datetime, date], observation: str
+    output_dir: PathLike,
+    observation_date: Union[datetime, date],
+    observation: str,
+    incremental: bool = False,
 ):
     """
     Writes daily average of observational data on given date.
@@ -51,6 +54,7 @@ def write_observation(
     :param output_dir: output directory to write files
     :param observation_date: fate of observation
     :param observation: observation to write
+    :param incremental: whether to update persisted composites with only the passes that arrived since the last run (VIIRS only)
     :raise _utilities.NoDataError: if no data found
     """
 
@@ -105,30 +109,46 @@ def write_observation(
             )
             del hfr_range
         elif observation == 'viirs':
-            viirs_range = viirs.VIIRSRange(day_start, day_end_utc)
-            viirs_range.write_raster(
-                observation_dir,
-                filename_suffix=f'{day_start:%Y%m%d%H%M}_{day_noon:%Y%m%d%H%M}',
-                start_time=day_start_utc,
-                end_time=day_noon_utc,
-                fill_value=LEAFLET_NODATA_VALUE,
-                driver='GTiff',
-                correct_sses=False,
-                variables=['sst'],
-            )
-            viirs_range.write_raster(
-                observation_dir,
-                filename_suffix=f'{day_noon:%Y%m%d%H%M}_{day_end:%Y%m%d%H%M}',
-                start_time=day_noon_utc,
-                end_time=day_end_utc,
-                fill_value=LEAFLET_NODATA_VALUE,
-                driver='GTiff',
-                correct_sses=False,
-                variables=['sst'],
-            )
-            del viirs_range
+            if incremental:
+                for start_time, end_time in ((day_start, day_noon), (day_noon, day_end)):
+                    try:
+                        viirs.update_composite(
+                            observation_dir,
+                            start_time=start_time + STUDY_AREA_TO_UTC,
+                            end_time=end_time + STUDY_AREA_TO_UTC,
+                            filename_suffix=f'{start_time:%Y%m%d%H%M}_{end_time:%Y%m%d%H%M}',
+                            variable='sst',
+                            correct_sses=False,
+                            fill_value=LEAFLET_NODATA_VALUE,
+                            driver='GTiff',
+                        )
+                    except NoDataError as error:
+                        LOGGER.warning(f'{error.__class__.__name__}: {error}')
+            else:
+                viirs_range = viirs.VIIRSRange(day_start, day_end_utc)
+                viirs_range.write_raster(
+                    observation_dir,
+                    filename_suffix=f'{day_start:%Y%m%d%H%M}_{day_noon:%Y%m%d%H%M}',
+                    start_time=day_start_utc,
+                    end_time=day_noon_utc,
+                    fill_value=LEAFLET_NODATA_VALUE,
+                    driver='GTiff',
+                    correct_sses=False,
+                    variables=['sst'],
+                )
+                viirs_range.write_raster(
+                    observation_dir,
+                    filename_suffix=f'{day_noon:%Y%m%d%H%M}_{day_end:%Y%m%d%H%M}',
+                    start_time=day_noon_utc,
+                    end_time=day_end_utc,
+                    fill_value=LEAFLET_NODATA_VALUE,
+                    driver='GTiff',
+                    correct_sses=False,
+                    variables=['sst'],
+                )
+                del viirs_range
         elif observation == 'smap':
-            smap_dataset = smap.SMAPDataset()
+            smap_dataset = smap.SMAPDataset(data_time=day_start_utc)
             smap_dataset.write_rasters(
                 observation_dir,
                 data_time=day_start_utc,
@@ -451,6 +471,7 @@ def write_observations(
     output_dir: PathLike,
     output_date: Union[datetime, date, int, float],
     day_deltas: range = MODEL_DAY_DELTAS['WCOFS'],
+    incremental: bool = False,
 ):
     """
     Writes daily average of observational data on given date.
@@ -458,6 +479,7 @@ def write_observations(
     :param output_dir: output directory to write files
     :param output_date: date of data run
     :param day_deltas: time deltas for which to write model output
+    :param incremental: whether to update persisted composites with only the passes that arrived since the last run
     """
 
     if not isinstance(output_dir, Path):
@@ -468,7 +490,7 @@ def write_observations(
     LOGGER.info('Processing HFR SSUV...')
     write_observation(output_dir, output_date, 'hf_radar')
     LOGGER.info('Processing VIIRS SST...')
-    write_observation(output_dir, output_date, 'viirs')
+    write_observation(output_dir, output_date, 'viirs', incremental)
     LOGGER.info('Processing SMAP SSS...')
     write_observation(output_dir, output_date, 'smap')
     # LOGGER.info('Processing NDBC data...')